@@ -0,0 +1,153 @@
+"""Warm the rule lookup caches with the lookups of recent submissions."""
+import logging
+import zlib
+from collections import Counter
+from dataclasses import asdict, dataclass
+from time import perf_counter
+from typing import Optional
+
+import aiomcache
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from .database import Submission
+from .docx_to_text import docx_to_text
+from .ity.taggers.docuscope_tagger_neo import BACKEND_ERRORS, DocuscopeTaggerNeo
+from .ity.tokenizers.regex_tokenizer import RegexTokenizer
+
+# Errors of memcache and of decoding its entries, which end the warm-up
+# rather than the startup that runs it.
+CACHE_ERRORS = (OSError, aiomcache.ClientException, ValueError, IndexError, zlib.error)
+
+
+@dataclass
+class WarmupReport:
+    """Summary of a cache warm-up."""
+    documents: int = 0  # submissions mined
+    windows: int = 0  # distinct long rule lookups found
+    short_windows: int = 0  # distinct short rule lookups found
+    resolved: int = 0  # lookups loaded into the caches
+    queried: int = 0  # of the resolved lookups, those not already in memcache
+    seconds: float = 0
+    complete: bool = True  # False if a budget or neo4j cut the warm-up short
+
+
+def _submission_text(content, name: str) -> Optional[str]:
+    """The text of a submission, None if it has none or cannot be read."""
+    try:
+        if name is not None and name.endswith(".docx") and content:
+            content = docx_to_text(content)
+        elif isinstance(content, bytes):
+            content = content.decode('utf-8', errors='replace')
+    except Exception as exc:  # pylint: disable=broad-except
+        logging.warning("Cache warm-up skipped %s: %s", name, exc)
+        return None
+    if not isinstance(content, str) or not content.strip():
+        return None
+    return content
+
+
+async def _mine_lookups(
+        engine: AsyncEngine, context: DocuscopeTaggerNeo, report: WarmupReport,
+        max_documents: int, deadline: float) -> tuple[dict, dict, Counter, Counter]:
+    """
+    Gather the long and short rule lookups of the max_documents most
+    recently created submissions, and count their occurrences, until
+    perf_counter() passes deadline.
+    """
+    long_counts: Counter = Counter()
+    short_counts: Counter = Counter()
+    long_lookups: dict = {}
+    short_lookups: dict = {}
+    tokenizer = RegexTokenizer()
+    async with engine.connect() as session:
+        results = await session.stream(
+            select(Submission.content, Submission.name)
+            .order_by(Submission.created.desc())
+            .limit(max_documents))
+        async for (content, name) in results:
+            if perf_counter() > deadline:
+                logging.warning("Cache warm-up stopped mining after %d documents.",
+                                report.documents)
+                report.complete = False
+                break
+            content = _submission_text(content, name)
+            if content is None:
+                continue
+            found = context.collect_lookups(
+                tokenizer.tokenize_table(content), long_counts, short_counts)
+            long_lookups.update(found[0])
+            short_lookups.update(found[1])
+            report.documents += 1
+            if report.documents % 100 == 0:
+                logging.info("Cache warm-up mined %d documents: %d windows, %d short windows.",
+                             report.documents, len(long_lookups), len(short_lookups))
+    report.windows = len(long_lookups)
+    report.short_windows = len(short_lookups)
+    return long_lookups, short_lookups, long_counts, short_counts
+
+
+async def _resolve_lookups(
+        context: DocuscopeTaggerNeo, ranked: list[tuple[int, bool, tuple]],
+        lookups: tuple[dict, dict], report: WarmupReport, deadline: float) -> None:
+    """
+    Resolve the ranked (count, short, window) lookups into the caches in
+    batches, until perf_counter() passes deadline or neo4j or memcache fail.
+    """
+    long_lookups, short_lookups = lookups
+    for start in range(0, len(ranked), context.batch_size):
+        if perf_counter() > deadline:
+            logging.warning("Cache warm-up ran out of time after %d lookups.", report.resolved)
+            report.complete = False
+            return
+        batch = ranked[start:start + context.batch_size]
+        try:
+            report.queried += await context.warm(
+                {window: long_lookups[window] for _, short, window in batch if not short},
+                {window: short_lookups[window] for _, short, window in batch if short})
+        except BACKEND_ERRORS as exc:
+            logging.warning("Cache warm-up stopped, neo4j unavailable: %s", exc)
+            report.complete = False
+            return
+        except CACHE_ERRORS as exc:
+            logging.warning("Cache warm-up stopped, memcache failed: %s", exc)
+            report.complete = False
+            return
+        report.resolved += len(batch)
+        logging.info("Cache warm-up resolved %d/%d lookups (%d queried), %.1fs left.",
+                     report.resolved, len(ranked), report.queried, deadline - perf_counter())
+
+
+async def warm_rule_cache(
+        engine: AsyncEngine,
+        tagger: DocuscopeTaggerNeo,
+        max_documents: int = 1000,
+        max_lookups: int = 50000,
+        max_seconds: float = 120) -> WarmupReport:
+    """
+    Find the most frequent rule lookups of the max_documents most recently
+    created submissions and resolve up to max_lookups of them into the
+    caches of tagger: memcache and the in-process tier.
+
+    Half of max_seconds is allowed for mining the submissions and whatever
+    is left for resolving the lookups, most frequent first.  Progress is
+    logged as it goes.  If neo4j or memcache fail, the warm-up stops there
+    and the report is marked incomplete.
+    """
+    start_time = perf_counter()
+    report = WarmupReport()
+    context = tagger.context()
+    long_lookups, short_lookups, long_counts, short_counts = await _mine_lookups(
+        engine, context, report, max_documents, start_time + max_seconds / 2)
+    ranked = sorted([(count, False, window) for window, count in long_counts.items()] +
+                    [(count, True, window) for window, count in short_counts.items()],
+                    key=lambda item: item[0], reverse=True)[:max_lookups]
+    logging.info("Cache warm-up resolving %d of %d lookups from %d documents.",
+                 len(ranked), len(long_counts) + len(short_counts), report.documents)
+    await _resolve_lookups(context, ranked, (long_lookups, short_lookups), report,
+                           start_time + max_seconds)
+    if tagger.cache_writer is not None:
+        await tagger.cache_writer.flush(max(max_seconds - (perf_counter() - start_time), 1))
+    report.seconds = perf_counter() - start_time
+    logging.info("Cache warm-up finished: %s", asdict(report))
+    return report
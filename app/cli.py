@@ -7,7 +7,6 @@ import asyncio
 import logging
 import traceback
 import uuid
-from collections import Counter
 from typing import Optional
 
 import aiomcache
@@ -17,15 +16,23 @@ from sqlalchemy.ext.asyncio import (AsyncEngine, AsyncSession,
                                     create_async_engine)
 from sqlalchemy.sql.expression import update
 
+from .cache_warmup import warm_rule_cache
 from .database import Submission
 from .default_settings import SETTINGS, SQLALCHEMY_DATABASE_URI
 from .docx_to_text import docx_to_text
-from .ds_tagger import get_wordclasses
+from .ds_tagger import (create_circuit_breaker, get_dictionary_fingerprint,
+                        get_fallback_rule_index, get_rule_index, get_wordclasses,
+                        parse_verbose_args)
 from .ity.formatters.simple_html_formatter import SimpleHTMLFormatter
 from .ity.tagger import ItyTaggerResult, tag_json
-from .ity.taggers.docuscope_tagger_neo import DocuscopeTaggerNeo
+from .ity.taggers.docuscope_tagger_base import DocuscopeTaggerBase
+from .ity.taggers.docuscope_tagger_index import DocuscopeTaggerIndex
+from .ity.taggers.docuscope_tagger_neo import (DocuscopeTaggerNeo, RuleDepths, ShortRules,
+                                               StartBigrams, load_rule_tables)
+from .ity.taggers.lat_rule_index import LatRuleIndex
+from .ity.taggers.rule_cache import CacheWriter, LocalRuleCache
 from .ity.tokenizers.regex_tokenizer import RegexTokenizer
-from .ity.tokenizers.tokenizer import TokenType
+from .ity.tokenizers.tokenizer import TokenType, count_token_types
 
 PARSER = argparse.ArgumentParser(
     prog="docuscope-tagger.sif",
@@ -40,35 +47,75 @@ PARSER.add_argument('-c', '--check_db', action='store_true',
                     help="Check the database for any 'pending' documents.")
 PARSER.add_argument('-m', '--max_db_documents', type=int, default=-1,
                     help="Maximum number of 'pending' documents to process.")
+PARSER.add_argument('-w', '--warm_cache', type=int, nargs='?', metavar='DOCUMENTS',
+                    const=SETTINGS.rule_cache_warmup_documents or 1000,
+                    help="Warm the rule cache with the lookups of the most recent "
+                    "DOCUMENTS submissions before tagging.")
 # PARSER.add_argument('-r', '--rule_db', help="Rule Database URI.") # from .env
 # PARSER.add_argument('--memcache', help="Memcache URI.") # from .env
-PARSER.add_argument('-v', '--verbose', help="Increase output verbosity.",
-                    action="count", default=0)
-ARGS = PARSER.parse_args()
-LEVELS = [logging.WARNING, logging.INFO, logging.DEBUG]
-logging.basicConfig(level=LEVELS[min(len(LEVELS)-1, ARGS.verbose)])
+ARGS = parse_verbose_args(PARSER)
 
 ENGINE: AsyncEngine = create_async_engine(SQLALCHEMY_DATABASE_URI)
 
 DRIVER = AsyncGraphDatabase.driver(
     SETTINGS.neo4j_uri,
     auth=(SETTINGS.neo4j_user,
-          SETTINGS.neo4j_password.get_secret_value()))  # pylint: disable=no-member
+          SETTINGS.neo4j_password.get_secret_value()),  # pylint: disable=no-member
+    max_connection_pool_size=SETTINGS.neo4j_max_connection_pool_size,
+    connection_acquisition_timeout=SETTINGS.neo4j_connection_acquisition_timeout)
 
 WORDCLASSES = get_wordclasses()
+RULE_INDEX = get_rule_index()
+CACHE_NAMESPACE = ""
+START_BIGRAMS: Optional[StartBigrams] = None
+SHORT_RULES: Optional[ShortRules] = None
+RULE_DEPTHS: Optional[RuleDepths] = None
+LOCAL_CACHE = LocalRuleCache(max_entries=SETTINGS.rule_cache_entries,
+                             max_bytes=SETTINGS.rule_cache_bytes,
+                             ttl=SETTINGS.rule_cache_ttl_seconds)
+SURFACE_CACHE = LocalRuleCache(max_entries=SETTINGS.surface_cache_entries,
+                               ttl=SETTINGS.rule_cache_ttl_seconds) \
+    if SETTINGS.surface_cache_entries > 0 else None
+CIRCUIT_BREAKER = create_circuit_breaker()
+FALLBACK_RULES: Optional[LatRuleIndex] = None
 
 
-async def tag(doc_content: str, cache: Optional[aiomcache.Client]):
-    """Construct and run the tagger on the given text."""
+def neo_tagger(cache: Optional[aiomcache.Client],
+               cache_writer: Optional[CacheWriter] = None) -> DocuscopeTaggerNeo:
+    """Construct a tagger that looks up the rules in neo4j."""
+    return DocuscopeTaggerNeo(return_untagged_tags=False,
+                              return_no_rules_tags=True, return_included_tags=True,
+                              wordclasses=WORDCLASSES, driver=DRIVER, cache=cache,
+                              local_cache=LOCAL_CACHE, cache_writer=cache_writer,
+                              cache_namespace=CACHE_NAMESPACE,
+                              start_bigrams=START_BIGRAMS, short_rules=SHORT_RULES,
+                              rule_depths=RULE_DEPTHS,
+                              cache_mode=SETTINGS.rule_cache_mode,
+                              surface_cache=SURFACE_CACHE,
+                              batch_size=SETTINGS.neo4j_batch_size,
+                              circuit_breaker=CIRCUIT_BREAKER, fallback=FALLBACK_RULES,
+                              plan_lookups=SETTINGS.plan_lookups,
+                              paragraph_concurrency=SETTINGS.paragraph_concurrency)
+
+
+def create_tagger(cache: Optional[aiomcache.Client],
+                  cache_writer: Optional[CacheWriter] = None) -> DocuscopeTaggerBase:
+    """Construct the tagger shared by all of the documents."""
+    if RULE_INDEX is not None:
+        return DocuscopeTaggerIndex(return_untagged_tags=False,
+                                    return_no_rules_tags=True, return_included_tags=True,
+                                    wordclasses=WORDCLASSES, rule_index=RULE_INDEX)
+    return neo_tagger(cache, cache_writer)
+
+
+async def tag(doc_content: str, tagger: DocuscopeTaggerBase):
+    """Run the tagger on the given text."""
     tokenizer = RegexTokenizer()
-    tokens = tokenizer.tokenize(doc_content)
-    tagger = DocuscopeTaggerNeo(return_untagged_tags=False,
-                                return_no_rules_tags=True, return_included_tags=True,
-                                wordclasses=WORDCLASSES, driver=DRIVER, cache=cache)
-    rules, tags = await tagger.tag(tokens)
+    tokens = tokenizer.tokenize_table(doc_content)
+    context = await tagger.tag_context(tokens)
     output = SimpleHTMLFormatter().format(
-        tags=(rules, tags), tokens=tokens, text_str=doc_content)
-    type_count = Counter([token.type for token in tokens])
+        tags=(context.rules, context.tags), tokens=tokens, text_str=doc_content)
+    type_count = count_token_types(tokens)
     not_excluded = set(TokenType) - set(tokenizer.excluded_token_types)
     return tag_json(ItyTaggerResult(
         format_output=output,
@@ -79,17 +126,18 @@ async def tag(doc_content: str, cache: Optional[aiomcache.Client]):
         num_punctuation_tokens=type_count[TokenType.PUNCTUATION],
         num_tokens=len(tokens),
         num_word_tokens=type_count[TokenType.WORD],
-        tag_chain=[tag.rules[0][0].split(
-            '.')[-1] for tag in tagger.tags],
-        tag_dict=tagger.rules,
-        text_contents=doc_content
+        tag_chain=context.tags.rule_names(short=True),
+        tag_dict=context.rules,
+        text_contents=doc_content,
+        backend=context.backend
     )).model_dump()
 
 
-async def tag_entry(doc_id: str, cache: Optional[aiomcache.Client]):
+async def tag_entry(doc_id: str, tagger: DocuscopeTaggerBase):
     """Use DocuScope tagger on the specified document.
     Arguments:
     doc_id: a uuid of the document in the database.
+    tagger: the tagger shared by all of the documents.
     """
     doc_content = None
     doc_processed = {"ERROR": "No file data to process."}
@@ -114,7 +162,7 @@ async def tag_entry(doc_id: str, cache: Optional[aiomcache.Client]):
         try:
             if doc_name.endswith(".docx"):
                 doc_content = docx_to_text(doc_content)
-            doc_processed = await tag(doc_content, cache)
+            doc_processed = await tag(doc_content, tagger)
             if doc_processed.get('ds_num_word_tokens', 0) == 0:
                 doc_state = "error"
                 doc_processed['error'] = 'Document failed to parse: no word tokens found.'
@@ -155,8 +203,8 @@ def valid_uuid(doc_id: str):
     return True
 
 
-async def run_tagger(args):
-    """Gathers the document ids and runs the tagger on them (multitreaded)"""
+async def get_document_ids(args) -> set[str]:
+    """The ids of the documents given in args that exist, and of the pending ones if checked."""
     ids = {id for id in args.uuid if valid_uuid(id)}  # only uuids
     async with ENGINE.connect() as session:
         # check if uuids are in database
@@ -175,8 +223,25 @@ async def run_tagger(args):
                 query = query.limit(args.max_db_documents)
             pending = await session.stream(query)
             valid_ids.update([str(id) async for (id,) in pending])
-    if valid_ids:
-        logging.info('Tagging: %s', valid_ids)
+    return valid_ids
+
+
+async def run_tagger(args):
+    """Gathers the document ids and runs the tagger on them (multitreaded)"""
+    # pylint: disable=global-statement
+    global START_BIGRAMS, SHORT_RULES, RULE_DEPTHS, CACHE_NAMESPACE, FALLBACK_RULES
+    # pylint: enable=global-statement
+    valid_ids = await get_document_ids(args)
+    if valid_ids or args.warm_cache:
+        if valid_ids:
+            logging.info('Tagging: %s', valid_ids)
+        rule_graph = ""
+        if RULE_INDEX is None:
+            START_BIGRAMS, SHORT_RULES, RULE_DEPTHS, rule_graph = await load_rule_tables(
+                DRIVER, SETTINGS.rule_cache_mode)
+            if SETTINGS.rule_fallback and valid_ids:
+                FALLBACK_RULES = get_fallback_rule_index()
+        CACHE_NAMESPACE = get_dictionary_fingerprint(rule_graph=rule_graph)
         cache = None
         try:
             cache = await aiomcache.Client(
@@ -186,9 +251,20 @@ async def run_tagger(args):
         # tag(list(valid_ids)[0])
         # tasks = [tag_entry(id) for id in valid_ids]
         # await asyncio.gather(*tasks)
+        cache_writer = CacheWriter(cache, max_queue=SETTINGS.rule_cache_write_queue) \
+            if cache else None
+        tagger = create_tagger(cache, cache_writer)
+        if args.warm_cache and RULE_INDEX is None:
+            await warm_rule_cache(ENGINE, tagger,
+                                  max_documents=args.warm_cache,
+                                  max_lookups=SETTINGS.rule_cache_warmup_lookups,
+                                  max_seconds=SETTINGS.rule_cache_warmup_seconds)
         for uid in valid_ids:
-            await tag_entry(uid, cache)
-        await cache.close()
+            await tag_entry(uid, tagger)
+        if cache_writer is not None:
+            await cache_writer.close()
+        if cache is not None:
+            await cache.close()
         # await asyncio.to_thread(tag, valid_ids)
 
         # with Pool() as pool:  # issues with running out of memory due to forking/copy
@@ -1,6 +1,6 @@
 """Defines and sets default values for configuation object."""
 import os
-from typing import Annotated
+from typing import Annotated, Literal, Optional
 from pydantic import AnyUrl, DirectoryPath, MySQLDsn, SecretStr, UrlConstraints
 from pydantic_settings import SettingsConfigDict, BaseSettings
 
@@ -14,6 +14,7 @@ class Settings(BaseSettings):
     Through the magic of pydantic and dotenv, these fields are
     configurable through environment variables and .env files."""
     dictionary: str = 'default'
+    dictionary_version: Optional[str] = None
     dictionary_home: DirectoryPath = os.path.join(
         os.path.dirname(__file__), 'dictionaries')
     db_host: str = '127.0.0.1'
@@ -22,11 +23,31 @@ class Settings(BaseSettings):
     db_user: str = 'docuscope'
     memcache_url: str = 'localhost'
     memcache_port: int = 11211
+    rule_cache_entries: int = 100000
+    rule_cache_bytes: int = 0
+    rule_cache_ttl_seconds: int = 3600
+    rule_cache_write_queue: int = 10000
+    rule_cache_mode: Literal['window', 'family', 'best'] = 'window'
+    surface_cache_entries: int = 100000
+    rule_cache_warmup_documents: int = 0
+    rule_cache_warmup_lookups: int = 50000
+    rule_cache_warmup_seconds: float = 120.0
     mysql_database: str = 'docuscope'
     neo4j_database: str = 'neo4j'
     neo4j_password: SecretStr = None
     neo4j_user: str = 'neo4j'
     neo4j_uri: Neo4JUrl = 'neo4j://localhost:7687/'
+    neo4j_max_connection_pool_size: int = 100
+    neo4j_connection_acquisition_timeout: float = 60.0
+    neo4j_batch_size: int = 500
+    plan_lookups: bool = True
+    paragraph_concurrency: int = 1
+    neo4j_timeout_seconds: Optional[float] = 10.0
+    neo4j_timeout_lookups: int = 100
+    neo4j_slow_seconds: Optional[float] = None
+    neo4j_failure_threshold: int = 5
+    neo4j_reset_seconds: float = 30.0
+    rule_fallback: bool = False
     sqlalchemy_track_modifications: bool = False
     scheduler_interval_seconds: int = 60
     model_config = SettingsConfigDict(env_file='.env', env_file_encoding='utf-8',
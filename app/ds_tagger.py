@@ -4,14 +4,18 @@ try:
 except ImportError:
     import json
 
+import argparse
 import gzip
+import hashlib
 import logging
 from pathlib import Path
 from typing import Optional
 
 from .default_settings import SETTINGS
 from .ity.tagger import ItyTagger, ds_tagger
+from .ity.taggers.circuit_breaker import CircuitBreaker
 from .ity.taggers.docuscope_tagger import DocuscopeDictionary
+from .ity.taggers.lat_rule_index import LatRuleIndex
 
 
 def get_dictionary(dictionary: Optional[str]=None) -> DocuscopeDictionary:
@@ -44,8 +48,77 @@ def get_wordclasses() -> dict[str, list[str]]:
         logging.error("Could not find %s", wcs)
     if data == {}:
         logging.error("No wordclasses in %s", wcs)
+    # Words with the same wordclasses share one list of one copy of the names.
+    names: dict[str, str] = {}
+    shared: dict[tuple[str, ...], list[str]] = {}
+    for word, wordclasses in data.items():
+        key = tuple(names.setdefault(name, name) for name in wordclasses)
+        data[word] = shared.setdefault(key, list(key))
     return data
 
+def rule_index_path(dictionary: Optional[str]=None) -> Path:
+    """Location of the exported LAT rule index for the given dictionary."""
+    dictionary = dictionary or SETTINGS.dictionary
+    return Path(SETTINGS.dictionary_home) / f'{dictionary}_rules.json.gz'
+
+def get_rule_index(dictionary: Optional[str]=None) -> Optional[LatRuleIndex]:
+    """Retrieve the LAT rule index generated by export_rule_index, if any."""
+    index_path = rule_index_path(dictionary)
+    if not index_path.is_file():
+        logging.warning("No rule index at %s, rules will be looked up in neo4j.", index_path)
+        return None
+    return LatRuleIndex.load(index_path)
+
+def get_fallback_rule_index(dictionary: Optional[str]=None) -> Optional[LatRuleIndex]:
+    """Build a local rule index from the JSON dictionary for when neo4j is unavailable.
+    This can take more than 30 seconds for a full dictionary."""
+    try:
+        return LatRuleIndex.from_dictionary(get_dictionary(dictionary))
+    except (OSError, EOFError, KeyError, TypeError, ValueError) as exc:
+        logging.warning("No fallback rules, tagging will fail when neo4j does: %s", exc)
+        return None
+
+def parse_verbose_args(parser: argparse.ArgumentParser) -> argparse.Namespace:
+    """Parse the command line with parser, adding -v for the logging level."""
+    parser.add_argument('-v', '--verbose', help="Increase output verbosity.",
+                        action="count", default=0)
+    args = parser.parse_args()
+    levels = [logging.WARNING, logging.INFO, logging.DEBUG]
+    logging.basicConfig(level=levels[min(len(levels)-1, args.verbose)])
+    return args
+
+def create_circuit_breaker() -> CircuitBreaker:
+    """The circuit breaker of the neo4j rule queries, as configured."""
+    return CircuitBreaker(failure_threshold=SETTINGS.neo4j_failure_threshold,
+                          timeout=SETTINGS.neo4j_timeout_seconds,
+                          timeout_lookups=SETTINGS.neo4j_timeout_lookups,
+                          slow_seconds=SETTINGS.neo4j_slow_seconds,
+                          reset_seconds=SETTINGS.neo4j_reset_seconds)
+
+def get_dictionary_fingerprint(dictionary: Optional[str]=None, rule_graph: str="") -> str:
+    """Short digest that identifies the dictionary version.
+
+    Used to namespace cached rule lookups so that entries of different
+    dictionary versions never collide.  The digest covers rule_graph, the
+    digest of the neo4j rule graph returned by load_rule_tables, so that
+    reloading the graph retires the cached lookups, and DICTIONARY_VERSION
+    when it is set, otherwise the dictionary files."""
+    dictionary = dictionary or SETTINGS.dictionary
+    digest = hashlib.blake2b(dictionary.encode('utf-8'), digest_size=8)
+    digest.update(rule_graph.encode('utf-8'))
+    if SETTINGS.dictionary_version:
+        digest.update(SETTINGS.dictionary_version.encode('utf-8'))
+        return digest.hexdigest()
+    home = Path(SETTINGS.dictionary_home)
+    for path in (home / f'{dictionary}.json.gz', home / f'{dictionary}.json',
+                 home / 'wordclasses.json', rule_index_path(dictionary)):
+        if path.is_file():
+            digest.update(path.name.encode('utf-8'))
+            with open(path, 'rb') as data:
+                for chunk in iter(lambda data=data: data.read(1 << 20), b''):
+                    digest.update(chunk)
+    return digest.hexdigest()
+
 def create_ds_tagger(dictionary: Optional[str]=None) -> ItyTagger:
     """Create DocuScope Ity tagger using the specified dictionary."""
     # profiles to taking over 30 seconds.
@@ -0,0 +1,44 @@
+"""Export the neo4j LAT rule graph to a local rule index file.
+Run with --help to see options.
+"""
+import argparse
+import asyncio
+import logging
+from time import perf_counter
+
+from neo4j import AsyncGraphDatabase
+
+from .default_settings import SETTINGS
+from .ds_tagger import parse_verbose_args, rule_index_path
+from .ity.taggers.docuscope_tagger_neo import get_all_lat_rules
+from .ity.taggers.lat_rule_index import LatRuleIndex
+
+
+async def export_rule_index(output: str) -> LatRuleIndex:
+    """Read all of the rules from neo4j and write them to output."""
+    driver = AsyncGraphDatabase.driver(
+        str(SETTINGS.neo4j_uri),
+        auth=(SETTINGS.neo4j_user,
+              SETTINGS.neo4j_password.get_secret_value()))  # pylint: disable=no-member
+    start_time = perf_counter()
+    try:
+        async with driver.session() as session:
+            rules = await session.execute_read(get_all_lat_rules)
+    finally:
+        await driver.close()
+    logging.info("Retrieved %d rules in %.1fs", len(rules), perf_counter() - start_time)
+    index = LatRuleIndex()
+    for rule in rules:
+        index.add_rule(rule['path'], rule['lat'])
+    index.dump(output)
+    logging.info("Wrote rule index to %s", output)
+    return index
+
+
+if __name__ == '__main__':
+    PARSER = argparse.ArgumentParser(
+        description="Export the DocuScope rules in neo4j to a local rule index.")
+    PARSER.add_argument('-o', '--output', default=str(rule_index_path()),
+                        help="Output file (default: %(default)s).")
+    ARGS = parse_verbose_args(PARSER)
+    asyncio.run(export_rule_index(ARGS.output))
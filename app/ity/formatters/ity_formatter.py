@@ -3,6 +3,7 @@
 __author__ = 'kohlmannj'
 
 import abc
+from collections.abc import Sequence
 from typing import Optional
 
 from ..taggers.tagger import TaggerRule, TaggerTag
@@ -72,8 +73,8 @@ class ItyFormatter(BaseClass):
     @abc.abstractmethod
     def format(
             self,
-            tags: Optional[tuple[dict[str, TaggerRule], list[TaggerTag]]] = None,
-            tokens: Optional[list[Token]] = None,
+            tags: Optional[tuple[dict[str, TaggerRule], Sequence[TaggerTag]]] = None,
+            tokens: Optional[Sequence[Token]] = None,
             text_str: Optional[str] = None) -> str:
         """ Compose output. """
         return ""
@@ -3,6 +3,7 @@
 
 import os
 import re
+from collections.abc import Sequence
 from typing import Optional
 from jinja2 import Environment, FileSystemLoader, select_autoescape
 
@@ -55,8 +56,8 @@ class SimpleHTMLFormatter(ItyFormatter):
     def format(
             self,
             tags: Optional[tuple[dict[str, TaggerRule],
-                                 list[TaggerTag]]] = None,
-            tokens: Optional[list[Token]] = None,
+                                 Sequence[TaggerTag]]] = None,
+            tokens: Optional[Sequence[Token]] = None,
             text_str: Optional[str] = None) -> str:
         if (tags is None or tokens is None or text_str is None):
             raise ValueError(
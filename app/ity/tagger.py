@@ -15,7 +15,7 @@ from .taggers.docuscope_tagger import DocuscopeTagger
 from .taggers.docuscope_tagger_neo import DocuscopeTaggerNeo
 from .taggers.tagger import Tagger, TaggerRule
 from .tokenizers.regex_tokenizer import RegexTokenizer
-from .tokenizers.tokenizer import Tokenizer, TokenType
+from .tokenizers.tokenizer import Tokenizer, TokenType, count_token_types
 
 
 class DocuScopeTagCount(BaseModel):
@@ -35,6 +35,7 @@ class DocuScopeTagResult(BaseModel):
     ds_tag_dict: dict[str, DocuScopeTagCount]
     ds_count_dict: dict[str, int]
     tagging_time: str
+    ds_backend: Optional[str] = None
 
 class ItyTaggerResult(BaseModel):
     """Model of Ity tagger results."""
@@ -48,6 +49,7 @@ class ItyTaggerResult(BaseModel):
     tag_chain: list[str]
     format_output: str
     tagging_time: Optional[timedelta] = None
+    backend: Optional[str] = None
 
 class ItyTagger():
     """ Base tagger class for tagging a string. """
@@ -60,7 +62,7 @@ class ItyTagger():
     def tag_string(self, string: str) -> ItyTaggerResult:
         """Tags a string."""
         start_time = datetime.now()
-        tokens = self.tokenizer.tokenize(string)
+        tokens = self.tokenizer.tokenize_table(string)
         logging.info("Tokenize %d in %s", len(tokens), datetime.now() - start_time)
         start_time = datetime.now()
         tag_dict, tag_map = self.tagger.tag(tokens)
@@ -73,7 +75,7 @@ class ItyTagger():
         )
         logging.info("Formatting time: %s", datetime.now() - start_time)
 
-        type_count = Counter([token.type for token in tokens])
+        type_count = count_token_types(tokens)
         not_excluded = set(TokenType) - set(self.tokenizer.excluded_token_types)
         return ItyTaggerResult(
             text_contents=string,
@@ -127,7 +129,8 @@ def tag_json(result: ItyTaggerResult) -> DocuScopeTagResult:
         ds_dictionary=SETTINGS.dictionary,
         ds_tag_dict=tags_dict,
         ds_count_dict=count_dict,
-        tagging_time=str(result.tagging_time)
+        tagging_time=str(result.tagging_time),
+        ds_backend=result.backend
     )
 
 def countdict(target_list):
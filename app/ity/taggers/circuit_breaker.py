@@ -0,0 +1,145 @@
+""" Circuit breaker for the rule backend. """
+# coding=utf-8
+import asyncio
+import logging
+from collections.abc import Awaitable, Callable
+from time import monotonic, perf_counter
+from typing import Any, Optional
+
+from neo4j.exceptions import DatabaseError, DriverError, TransientError
+
+# Errors of the backend itself, as opposed to errors of the queries sent to
+# it (neo4j's ClientError) or of the caller, which are not its failures.
+BACKEND_FAILURES = (DriverError, DatabaseError, TransientError)
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a backend that the circuit breaker has cut off."""
+
+
+class CircuitBreaker:  # pylint: disable=too-many-instance-attributes
+    """
+    Stop calling a backend that keeps failing or stalling so that callers
+    can fall back to another rule source instead of waiting on it.
+
+    A call fails if it raises one of BACKEND_FAILURES, if it takes longer
+    than timeout seconds (it is then cancelled), or if it takes longer than
+    slow_seconds.  Other errors are raised without counting.  After
+    failure_threshold consecutive failures the circuit opens and calls
+    raise CircuitOpenError without reaching the backend.  After
+    reset_seconds a single probe call is let through (half-open): its
+    success closes the circuit again, its failure reopens it.
+
+    A call that resolves a batch of lookups is allowed timeout seconds
+    for every timeout_lookups of them.  A batch that still times out is
+    counted as slow rather than as a failure, so that one large document
+    on a cold cache does not cut the backend off for every other one.
+    """
+
+    def __init__(self, failure_threshold: int = 5, timeout: Optional[float] = 10.0,
+                 slow_seconds: Optional[float] = None, reset_seconds: float = 30.0,
+                 timeout_lookups: int = 100):
+        self.failure_threshold = failure_threshold
+        self.timeout = timeout  # None for no time limit.
+        self.timeout_lookups = timeout_lookups
+        self.slow_seconds = slow_seconds  # None to not count slow calls.
+        self.reset_seconds = reset_seconds
+        self.failures = 0  # consecutive failures
+        self._opened_at: Optional[float] = None
+        self._probing = False
+        self.calls = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.slow_calls = 0
+        self.rejected = 0
+        self.trips = 0
+        self.last_error = ""
+
+    @property
+    def state(self) -> str:
+        """"closed", "open", or "half_open" if a probe call may be made."""
+        if self._opened_at is None:
+            return "closed"
+        if self._probing or monotonic() - self._opened_at < self.reset_seconds:
+            return "open"
+        return "half_open"
+
+    def allow(self) -> bool:
+        """True if a call may be made now."""
+        return self.state != "open"
+
+    def timeout_for(self, size: int) -> Optional[float]:
+        """The time limit of a call that resolves size lookups."""
+        if self.timeout is None:
+            return None
+        return self.timeout * max(1.0, size / self.timeout_lookups)
+
+    async def call(self, func: Callable[[], Awaitable[Any]], size: int = 1) -> Any:
+        """
+        Await func() unless the circuit is open, recording the outcome.
+
+        :param size: the number of lookups that func resolves.
+        """
+        state = self.state
+        if state == "open":
+            self.rejected += 1
+            raise CircuitOpenError(f"Rule backend unavailable: {self.last_error}")
+        if state == "half_open":
+            self._probing = True
+        self.calls += 1
+        start_time = perf_counter()
+        timeout = self.timeout_for(size)
+        try:
+            result = await asyncio.wait_for(func(), timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            if size > 1:
+                self.slow_calls += 1
+                self.last_error = f"batch of {size} timed out after {timeout:.1f}s"
+                self._probing = False
+            else:
+                self._failure(f"timed out after {timeout}s")
+            raise
+        except BACKEND_FAILURES as exc:
+            self.errors += 1
+            self._failure(f"{type(exc).__name__}: {exc}")
+            raise
+        except BaseException:  # cancelled, or not the backend's failure
+            self._probing = False
+            raise
+        elapsed = perf_counter() - start_time
+        if self.slow_seconds is not None and elapsed > self.slow_seconds:
+            self.slow_calls += 1
+            self._failure(f"slow call ({elapsed:.3f}s)")
+        else:
+            self._success()
+        return result
+
+    def _success(self) -> None:
+        if self._opened_at is not None:
+            logging.info("Rule backend recovered, closing the circuit.")
+        self.failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    def _failure(self, error: str) -> None:
+        self.failures += 1
+        self.last_error = error
+        if self._probing or (self._opened_at is None and
+                             self.failures >= self.failure_threshold):
+            logging.warning("Rule backend failing (%s), opening the circuit for %.0fs.",
+                            error, self.reset_seconds)
+            self.trips += 1
+            self._opened_at = monotonic()
+        self._probing = False
+
+    def stats(self) -> dict[str, Any]:
+        """Counters for monitoring the backend's health."""
+        return {"state": self.state,
+                "failures": self.failures,
+                "calls": self.calls,
+                "errors": self.errors,
+                "timeouts": self.timeouts,
+                "slow_calls": self.slow_calls,
+                "rejected": self.rejected,
+                "trips": self.trips,
+                "last_error": self.last_error}
@@ -1,14 +1,13 @@
 """ The DocuScope Tagger """
 # coding=utf-8
 
-from itertools import product
-import logging
 from typing import Optional
 
 from pydantic.main import BaseModel
 
-from .docuscope_tagger_base import (DocuscopeTaggerBase, LatRule,
-                                    rule_applies_for_tokens)
+from .docuscope_tagger_base import DocuscopeTaggerBase, LatRule
+from .rule_automaton import RuleAutomaton
+from .rule_starts import RuleStarts
 
 
 class DocuscopeDictionary(BaseModel):
@@ -53,37 +52,43 @@ class DocuscopeTagger(DocuscopeTaggerBase):
         self.rules_db = dictionary['rules']
         self.short_rules_db = dictionary['shortRules']
         self.wordclasses: dict[str, list[str]] = dictionary["words"]
+        self.rule_automaton = RuleAutomaton(self.rules_db)
+        # Long rules by token index of self.tokens, found in one pass when
+        # every token is a start (allow_overlapping_tags).
+        self._long_rules: Optional[dict[int, LatRule]] = None
 
-    async def get_long_rule(self):
-        next_token_index = self._get_nth_next_included_token_index()
-        rules: list[LatRule] = []
-        # cartesian product of the first and second word for token lists
-        for token_ds_word, next_token_ds_word in product(
-            self._get_ds_words_for_token_index(self.token_index),
-            self._get_ds_words_for_token_index(next_token_index)):
-            try:
-                rule_dict = self.rules_db[token_ds_word][next_token_ds_word]
-            except KeyError:
-                continue # skip if rule for given pair does not exist
-            except Exception as exp:
-                logging.error(exp)
-                raise
-            for ds_lat, ds_rules in rule_dict.items():
-                for ds_partial_rule in ds_rules:
-                    # reconstruct full path
-                    ds_rule = [token_ds_word, next_token_ds_word, *ds_partial_rule]
-                    rules.append({"lat": ds_lat, "path": ds_rule})
-        # sort by length of the path, longest to shortest
-        rules.sort(reverse=True, key=lambda lr: len(lr['path']))
-        # get the first applicable rule which due to the sorting will
-        # be the longest applicable rule.
-        tokens = self.get_next_tokens_in_range(0, len(rules[0]['path'])) if len(rules) > 0 else []
-        best_ds_rule = next(
-            (r for r in rules if rule_applies_for_tokens(r['path'], tokens, offset=2)),
-            None)
-        return best_ds_rule
+    def _on_tokens_changed(self) -> None:
+        self._long_rules = None
 
-    async def get_short_rule(self, token_ds_words: list[str]):
+    def _scan_long_rules(self) -> dict[int, LatRule]:
+        """The long rule of every token index where one applies."""
+        included, _ = self._included_token_indexes or self._index_included_tokens()
+        ds_word_ids = self._resolve_ds_word_ids(self.rule_automaton.word_ids)
+        string_id = self.tokens.string_id
+        long_rules = self.rule_automaton.scan(
+            ds_word_ids[string_id[index]] for index in included)
+        self._long_rules = {included[rank]: rule for rank, rule in long_rules.items()}
+        return self._long_rules
+
+    def find_long_rule(self) -> Optional[LatRule]:
+        if self.allow_overlapping_tags:
+            long_rules = self._long_rules if self._long_rules is not None \
+                else self._scan_long_rules()
+            return long_rules.get(self.token_index)
+        return self.rule_automaton.match(
+            self._iter_next_ds_word_ids(self.rule_automaton.word_ids))
+
+    @property
+    def _rule_starts(self) -> Optional[RuleStarts]:
+        return self.rule_automaton.rule_starts
+
+    def _fork(self) -> 'DocuscopeTagger':
+        self._resolve_ds_word_ids(self.rule_automaton.word_ids)  # shared with the workers
+        if self.allow_overlapping_tags and self._long_rules is None:
+            self._scan_long_rules()
+        return super()._fork()
+
+    def find_short_rule(self, token_ds_words: list[str]):
         # Try to find a short rule for one of this token's ds_words.
         #with shelve.open('short_rules', flag='r') as rules_db:
         for ds_word in token_ds_words:
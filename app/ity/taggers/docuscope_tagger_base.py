@@ -1,11 +1,20 @@
 """ The DocuScope Tagger Common methods. """
 # coding=utf-8
-import abc
+import asyncio
+import copy
 import logging
+from collections.abc import AsyncIterator, Container, Iterator, Sequence
 from typing import Optional, TypedDict
 
 from ..tokenizers.tokenizer import Token, TokenType
-from .tagger import Tagger, TaggerRule, TaggerTag
+from .rule_starts import RuleStarts
+from .tagger import TagStore, Tagger, TaggerRule, TaggerTag
+from .vocabulary import Vocabulary
+
+# Token that marks a paragraph break (see docx_to_text).
+PARAGRAPH_MARKER = "PZPZPZ"
+# Tokens tagged between the yields of tag_next when tagging synchronously.
+TAG_NEXT_STEP = 1000
 
 
 class LatRule(TypedDict):
@@ -15,7 +24,7 @@ class LatRule(TypedDict):
     path: list[str]  # The list of strings that make up the rule pattern.
 
 
-class DocuscopeTaggerBase(Tagger):
+class DocuscopeTaggerBase(Tagger):  # pylint: disable=too-many-instance-attributes
     """
     DocuscopeTagger uses an implementation of the Docuscope rule-matching
     algorithm to apply rules ("lats") from the Docucsope dictionary (by Kaufer
@@ -56,18 +65,26 @@ class DocuscopeTaggerBase(Tagger):
                 TokenType.WHITESPACE,
                 TokenType.NEWLINE
             ),
+            paragraph_concurrency: int = 1,
             **kwargs):
         super().__init__(
             excluded_token_types=excluded_token_types,
             *args, **kwargs)
         # This is a weird setting
         self.allow_overlapping_tags = allow_overlapping_tags
+        # Number of paragraphs whose rules are looked up at the same time
+        # (by taggers that do not resolve their rules synchronously).
+        self.paragraph_concurrency = paragraph_concurrency
         self.wordclasses: dict[str, list[str]] = {}
 
     def _get_ds_words_for_token(self, token: Token, case_sensitive: bool = False) -> list[str]:
         """ Get all the string representations of this token. """
         # Get all the str representations of this token.
-        token_strs = token.strings
+        return self._get_ds_words_for_strings(token.strings, case_sensitive)
+
+    def _get_ds_words_for_strings(
+            self, token_strs: list[str], case_sensitive: bool = False) -> list[str]:
+        """ Get the wordclasses of a token from its strings. """
         # Try to find a matching Docuscope token while we still have
         # token_strs to try with.
         ds_words = []
@@ -87,32 +104,96 @@ class DocuscopeTaggerBase(Tagger):
             self, token_index: int, case_sensitive: bool = False) -> list[str]:
         """ Get the string representations of the token at the index position. """
         try:
-            token = self.tokens[token_index]
-            return self._get_ds_words_for_token(token, case_sensitive)
+            if not case_sensitive:
+                return (self._token_ds_words or self._resolve_ds_words())[0][token_index]
+            return self._get_ds_words_for_strings(self.tokens.strings_of(token_index),
+                                                  case_sensitive)
         except IndexError:
             return []
 
-    @abc.abstractmethod
+    @Tagger.tokens.setter
+    def tokens(self, tokens: Sequence[Token]) -> None:
+        Tagger.tokens.fset(self, tokens)
+        self._token_ds_words: Optional[tuple[list[list[str]],
+                                             list[frozenset[str]]]] = None
+        self._token_ds_word_ids: Optional[tuple[Vocabulary, list[tuple[int, ...]]]] = None
+        self._long_rule_starts: Optional[bytearray] = None
+        self._on_tokens_changed()
+
+    def _on_tokens_changed(self) -> None:
+        """Hook for subclasses to reset what they derived from the previous tokens."""
+
+    def _resolve_ds_words(self) -> tuple[list[list[str]], list[frozenset[str]]]:
+        """
+        Look up the wordclasses of each distinct token surface in the
+        document once: for each token index, its wordclasses and the same
+        as a frozenset, shared by all the tokens with that surface.
+        """
+        resolved = [self._get_ds_words_for_strings(strings) for strings in self.tokens.strings]
+        resolved_sets = [frozenset(words) for words in resolved]
+        self._token_ds_words = ([resolved[string_id] for string_id in self.tokens.string_id],
+                                [resolved_sets[string_id] for string_id in self.tokens.string_id])
+        return self._token_ds_words
+
+    def _resolve_ds_word_ids(self, vocabulary: Vocabulary) -> list[tuple[int, ...]]:
+        """
+        The ids in vocabulary of the wordclasses of each distinct token
+        surface in the document (by TokenTable.string_id), computed once.
+        """
+        if self._token_ds_word_ids is None or self._token_ds_word_ids[0] is not vocabulary:
+            self._token_ds_word_ids = (vocabulary, [
+                vocabulary.encode(self._get_ds_words_for_strings(strings))
+                for strings in self.tokens.strings])
+        return self._token_ds_word_ids[1]
+
+    @property
+    def resolves_synchronously(self) -> bool:
+        """
+        True if find_long_rule and find_short_rule resolve the rules without
+        I/O, so that tagging runs synchronously (see tag_context_sync).
+        Taggers that look their rules up elsewhere override get_long_rule
+        and get_short_rule instead and return False.
+        """
+        return True
+
+    def find_long_rule(self) -> Optional[LatRule]:
+        """Synchronously return the longest matching LAT rule of at least two words."""
+        return None
+
     async def get_long_rule(self) -> Optional[LatRule]:
         """Return the longest matching LAT rule that is at least lenght two."""
-        return None
+        return self.find_long_rule()
 
-    async def _get_long_rule_tag(self) -> tuple[Optional[TaggerRule], Optional[TaggerTag]]:
+    def _long_rule_may_apply(self) -> bool:
+        """False if there is no point looking for a long rule at the current token."""
         # Is this token's type one that is excluded?
-        if self.tokens[self.token_index].type in self.excluded_token_types:
+        if self.tokens.type_of(self.token_index) in self.excluded_token_types:
             # Early return, then.
-            return None, None
+            return False
         # Is there a next token?
         next_token_index = self._get_nth_next_included_token_index()
         if next_token_index is None:
             # Nope, no next token, so we can't look for long rules.
+            return False
+        # Can any rule start with this token and the next ones?
+        return self._can_start_long_rule()
+
+    async def _get_long_rule_tag(self) -> tuple[Optional[TaggerRule], Optional[TaggerTag]]:
+        if not self._long_rule_may_apply():
             return None, None
         # Oh good, there's a next token. Go find the longest rule, then.
         # This algorithm below is based on Mike Gleicher's DocuscopeJr tagger.
         # Modified to use a Neo4J database for lookups (Michael Ringenberg)
+        return self._long_rule_tag(await self.get_long_rule())
 
-        ds_rule = await self.get_long_rule()
+    def _get_long_rule_tag_sync(self) -> tuple[Optional[TaggerRule], Optional[TaggerTag]]:
+        if not self._long_rule_may_apply():
+            return None, None
+        return self._long_rule_tag(self.find_long_rule())
 
+    def _long_rule_tag(
+            self, ds_rule: Optional[LatRule]) -> tuple[Optional[TaggerRule], Optional[TaggerTag]]:
+        """The rule and tag of the long rule ds_rule at the current token."""
         if ds_rule is not None:
             rule = TaggerRule()
             tag = TaggerTag()
@@ -127,10 +208,10 @@ class DocuscopeTaggerBase(Tagger):
             tag.rules = [(rule.full_name, ds_rule['path'])]
             tag.index_start = self.token_index
             tag.index_end = last_token_index
-            tag.pos_start = self.tokens[self.token_index].position
-            tag.pos_end = self.tokens[last_token_index].position
+            tag.pos_start = self.tokens.position[self.token_index]
+            tag.pos_end = self.tokens.position[last_token_index]
             tag.len = tag.index_end - tag.index_start + 1
-            tag.token_end_len = self.tokens[last_token_index].length
+            tag.token_end_len = self.tokens.length[last_token_index]
             tag.num_included_tokens = len(ds_rule['path'])
             # Okay, do we have a valid rule and tag to return? (That's the best rule).
             if self._is_valid_rule(rule) and self._is_valid_tag(tag):
@@ -139,10 +220,59 @@ class DocuscopeTaggerBase(Tagger):
         # No long rule applies.
         return None, None
 
-    def get_next_ds_words_in_range(self, start: int, end: int) -> list[set[str]]:
+    @property
+    def _rule_starts(self) -> Optional[RuleStarts]:
+        """
+        The first steps of the long rules, if they are known up front.
+        Taggers that hold their rules in memory override this.
+        """
+        return None
+
+    def _can_start_long_rule(self) -> bool:
+        """
+        False if no long rule can start at the current token.  The first
+        call checks all of the tokens at once (see RuleStarts.candidates).
+        """
+        if self._long_rule_starts is None:
+            rule_starts = self._rule_starts
+            if rule_starts is None:
+                return True
+            self._index_long_rule_starts(rule_starts)
+        return bool(self._long_rule_starts[self.token_index])
+
+    def _index_long_rule_starts(self, rule_starts: RuleStarts) -> None:
+        """Flag the token indexes at which a long rule may start."""
+        included, _ = self._included_token_indexes or self._index_included_tokens()
+        string_id = self.tokens.string_id
+        self._long_rule_starts = bytearray(len(self.tokens))
+        for rank in rule_starts.candidates(self._resolve_ds_word_ids(rule_starts.word_ids),
+                                           [string_id[index] for index in included]):
+            self._long_rule_starts[included[rank]] = 1
+
+    @property
+    def backend(self) -> str:
+        """The rule source that produced the tags."""
+        return "local"
+
+    def get_next_ds_words_in_range(self, start: int, end: int) -> list[frozenset[str]]:
         """Get the list of sets of tokens from offset m to n from the current token index"""
-        return [set(self._get_ds_words_for_token(token))
-                for token in self.get_next_tokens_in_range(start, end)]
+        ds_word_sets = (self._token_ds_words or self._resolve_ds_words())[1]
+        return [ds_word_sets[index]
+                for index in self._get_next_token_indexes_in_range(start, end)]
+
+    def _iter_next_ds_word_ids(self, vocabulary: Vocabulary) -> Iterator[tuple[int, ...]]:
+        """
+        Lazily generate the wordclasses of the current and following
+        included tokens, encoded by vocabulary.
+        """
+        if self.token_index >= len(self.tokens):
+            return
+        ds_word_ids = self._resolve_ds_word_ids(vocabulary)
+        string_id = self.tokens.string_id
+        included, following = self._included_token_indexes or self._index_included_tokens()
+        yield ds_word_ids[string_id[self.token_index]]
+        for rank in range(following[self.token_index], len(included)):
+            yield ds_word_ids[string_id[included[rank]]]
 
     def _long_rule_applies_at_token_index(self, rule: list[str]) -> bool:
         """ Check if rule applies at the current location. """
@@ -161,32 +291,50 @@ class DocuscopeTaggerBase(Tagger):
         except IndexError:
             return False
 
-    @abc.abstractmethod
+    def find_short_rule(
+            self, token_ds_words: list[str]  # pylint: disable=unused-argument
+    ) -> tuple[Optional[str], Optional[str]]:
+        """Synchronously lookup a matching short rule for a list of token words."""
+        return None, None
+
     async def get_short_rule(self,
                              token_ds_words: list[str]) -> tuple[Optional[str], Optional[str]]:
         """For a list of token words, lookup a matching short rule."""
-        return None, None
+        return self.find_short_rule(token_ds_words)
 
     async def _get_short_rule_tag(self) -> tuple[TaggerRule, TaggerTag]:
         """ Get an applicable unigram rule. """
+        short_rule = None, None
+        if self.tokens.type_of(self.token_index) not in self.excluded_token_types:
+            short_rule = await self.get_short_rule(
+                self._get_ds_words_for_token_index(self.token_index))
+        return self._short_rule_tag(*short_rule)
+
+    def _get_short_rule_tag_sync(self) -> tuple[TaggerRule, TaggerTag]:
+        short_rule = None, None
+        if self.tokens.type_of(self.token_index) not in self.excluded_token_types:
+            short_rule = self.find_short_rule(
+                self._get_ds_words_for_token_index(self.token_index))
+        return self._short_rule_tag(*short_rule)
+
+    def _short_rule_tag(self, lat: Optional[str],
+                        matching_ds_word: Optional[str]) -> tuple[TaggerRule, TaggerTag]:
+        """The rule and tag of the current token given its short rule, if any."""
         rule = TaggerRule()
         # Some data for the current token.
-        token = self.tokens[self.token_index]
-        token_ds_words = self._get_ds_words_for_token(token)
+        token_ds_words = self._get_ds_words_for_token_index(self.token_index)
         # Update some information in tag right away for this one-token tag.
         tag = TaggerTag()
         tag.index_start = self.token_index
         tag.index_end = self.token_index
-        tag.pos_start = token.position
-        tag.pos_end = token.position
+        tag.pos_start = self.tokens.position[self.token_index]
+        tag.pos_end = tag.pos_start
         tag.len = 1
         tag.num_included_tokens = 1
-        tag.token_end_len = token.length
+        tag.token_end_len = self.tokens.length[self.token_index]
         # For words and punctuation...
-        matching_ds_word = None
-        if token.type not in self.excluded_token_types:
-            # Try to find a short rule for one of this token's ds_words.
-            lat, matching_ds_word = await self.get_short_rule(token_ds_words)
+        if self.tokens.type_of(self.token_index) not in self.excluded_token_types:
+            # The short rule for one of this token's ds_words.
             rule.name = lat
             # Handle "no rule" included tokens (words and punctuation that
             # exist in the Docuscope dictionary's words dict but do not have
@@ -214,6 +362,12 @@ class DocuscopeTaggerBase(Tagger):
 
     async def _get_tag(self) -> None:
         """ Try to find a tag for the current file position. """
+        rule, tag = await self._find_tag()
+        self._add_tag(rule, tag)
+        self.token_index = self._next_token_index(tag)
+
+    async def _find_tag(self) -> tuple[TaggerRule, TaggerTag]:
+        """ Find the rule and tag for the current file position. """
         # Try finding a long rule.
         rule, tag = await self._get_long_rule_tag()
         # If the long rule and tag are invalid (i.e. we got None and None),
@@ -223,14 +377,26 @@ class DocuscopeTaggerBase(Tagger):
             # "no rule", or "excluded" rules). This method *should* never
             # return None, None (but technically it can).
             rule, tag = await self._get_short_rule_tag()
+        return self._checked_tag(rule, tag)
+
+    def _find_tag_sync(self) -> tuple[TaggerRule, TaggerTag]:
+        """ _find_tag with the rules of find_long_rule and find_short_rule. """
+        rule, tag = self._get_long_rule_tag_sync()
+        if not self._is_valid_rule(rule) and not self._is_valid_tag(tag):
+            rule, tag = self._get_short_rule_tag_sync()
+        return self._checked_tag(rule, tag)
+
+    def _checked_tag(self, rule: TaggerRule, tag: TaggerTag) -> tuple[TaggerRule, TaggerTag]:
         # We should absolutely have a valid rule and tag at this point.
         if not self._is_valid_rule(rule) or not self._is_valid_tag(tag):
             raise ValueError(f"Unexpected None, None return values from "
                              f"self._get_short_rule_tag(). Can't tag token "
                              f"'{self.tokens[self.token_index]}' "
                              f"at index {self.token_index}.")
-        # Add the rule to self.rules (if we're supposed to) and add the tag to
-        # self.tags.
+        return rule, tag
+
+    def _add_tag(self, rule: TaggerRule, tag: TaggerTag) -> None:
+        """ Add the rule to self.rules (if we're supposed to) and the tag to self.tags. """
         if self._should_return_rule(rule):
             # Is this the first time we've seen this rule?
             if rule.full_name not in self.rules:
@@ -246,50 +412,212 @@ class DocuscopeTaggerBase(Tagger):
             # Debug: print the tokens that have been tagged.
             if logging.getLogger(__name__).isEnabledFor(logging.DEBUG):
                 tag_token_strs = []
-                for token in self.tokens[tag.index_start:(tag.index_end + 1)]:
-                    tag_token_strs.append(token.strings[-1])
+                for index in range(tag.index_start, tag.index_end + 1):
+                    tag_token_strs.append(self.tokens.strings_of(index)[-1])
                 logging.debug(">>> BEST RULE: %s for \"%s\"",
                               rule.name, str(tag_token_strs))
 
-        # Compute the new token index.
+    def _next_token_index(self, tag: TaggerTag) -> int:
+        """ Compute the new token index. """
         # If "overlapping tags" are allowed, start at the token following
         # the **first** token in the tag we just finished making.
         if self.allow_overlapping_tags:
-            self.token_index = tag.index_start + 1
+            return tag.index_start + 1
         # Otherwise, start at the token following the **last** token in the
         # tag we just finished making.
-        else:
-            self.token_index = tag.index_end + 1
+        return tag.index_end + 1
+
+    def context(self) -> 'DocuscopeTaggerBase':
+        """
+        A copy of this tagger with a tagging state of its own, for tagging
+        one document.  It shares the settings, rule tables and caches of
+        this tagger, which it leaves untouched, so that one long lived
+        tagger can tag any number of documents at the same time.
+        """
+        context = copy.copy(self)
+        context.reset()
+        return context
+
+    def _fork(self) -> 'DocuscopeTaggerBase':
+        """A copy of this tagger that can tag another part of self.tokens concurrently."""
+        # Resolved once here so that the workers share them.
+        if self._token_ds_words is None:
+            self._resolve_ds_words()
+        if self._included_token_indexes is None:
+            self._index_included_tokens()
+        if self._long_rule_starts is None and (rule_starts := self._rule_starts) is not None:
+            self._index_long_rule_starts(rule_starts)
+        worker = copy.copy(self)
+        worker.rules = {}
+        worker.tags = TagStore()
+        return worker
+
+    async def find_tags(
+            self, start: int, end: int, stop: Container[int] = ()
+    ) -> tuple[list[tuple[int, TaggerRule, TaggerTag]], int]:
+        """
+        Find the tags from token index start on, as the tagging loop would,
+        until reaching end or a token index in stop.
+
+        :return: the (token index, rule, tag) of each tag found and the
+                 token index reached.
+        """
+        self.token_index = start
+        found = []
+        while self.token_index < min(end, len(self.tokens)) and self.token_index not in stop:
+            index = self.token_index
+            rule, tag = await self._find_tag()
+            found.append((index, rule, tag))
+            self.token_index = self._next_token_index(tag)
+        return found, self.token_index
+
+    def _lookups_overlap(self) -> bool:
+        """Whether rule lookups are left to overlap by tagging paragraphs concurrently."""
+        return True
+
+    def _paragraph_starts(self) -> list[int]:
+        """Token indexes at which paragraphs start, after each PARAGRAPH_MARKER."""
+        return [0] + [index + 1 for index in range(len(self.tokens) - 1)
+                      if PARAGRAPH_MARKER in self.tokens.strings_of(index)]
+
+    async def _tag_paragraphs(self) -> AsyncIterator[int]:
+        """
+        Find the tags of up to paragraph_concurrency paragraphs at a time
+        and add them in order, yielding the token index reached.
+
+        A tag may still span a paragraph break, so the tags found for a
+        paragraph are only used from the first one that starts where the
+        previous paragraph's tags end; before that, the paragraph is tagged
+        again from there.  The result is the same as tagging in order.
+        Nothing is tagged when there are no lookups left to overlap.
+        """
+        if not self._lookups_overlap():
+            return
+        starts = self._paragraph_starts()
+        bounds = list(zip(starts, starts[1:] + [len(self.tokens)]))
+        semaphore = asyncio.Semaphore(self.paragraph_concurrency)
+
+        async def find(start: int, end: int):
+            async with semaphore:
+                worker = self._fork()
+                try:
+                    return await worker.find_tags(start, end)
+                finally:
+                    await worker.finish()
 
-    async def tag_next(self, tokens: list[Token]) -> int:
-        """Tag the next token."""
+        tasks = [asyncio.ensure_future(find(start, end)) for start, end in bounds]
+        try:
+            for (start, end), task in zip(bounds, tasks):
+                found, reached = await task
+                if self.token_index > start:  # the last tag spanned the break
+                    found, reached = await self._retag_from_break(found, reached, end)
+                for _, rule, tag in found:
+                    self._add_tag(rule, tag)
+                self.token_index = reached
+                yield self.token_index
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _retag_from_break(
+            self, found: list[tuple[int, TaggerRule, TaggerTag]], reached: int, end: int
+    ) -> tuple[list[tuple[int, TaggerRule, TaggerTag]], int]:
+        """
+        Tag a paragraph again from self.token_index, where the previous
+        paragraph's last tag ended, until reaching a tag of found, and
+        return the tags and the token index reached from there.
+        """
+        starts_found = {index for index, _, _ in found}
+        retagged, index = await self.find_tags(self.token_index, end, starts_found)
+        found = retagged + [item for item in found if item[0] >= index]
+        return found, reached if index in starts_found else index
+
+    async def prepare(self) -> None:
+        """
+        Hook for work that needs all of self.tokens before tagging starts,
+        for taggers that do not resolve their rules synchronously.
+        """
+
+    async def finish(self) -> None:
+        """Hook for releasing what was held for tagging self.tokens, always called after prepare."""
+
+    def _tag_until(self, end: int) -> None:
+        """
+        The synchronous core of tagging: tag from self.token_index until
+        reaching end, with the rules of find_long_rule and find_short_rule.
+        """
+        while self.token_index < end:
+            logging.debug("\nPassing self.tokens[%d] = %s",
+                          self.token_index, self.tokens.strings_of(self.token_index))
+            rule, tag = self._find_tag_sync()
+            self._add_tag(rule, tag)
+            self.token_index = self._next_token_index(tag)
+
+    def tag_next_sync(self, tokens: Sequence[Token]) -> Iterator[int]:
+        """
+        tag_next without an event loop, for taggers that resolve their
+        rules synchronously, yielding every TAG_NEXT_STEP tokens.
+        """
         self.reset()
         self.tokens = tokens
-        while (self.token_index < len(self.tokens) and
-               self.token_index is not None):
-            logging.debug("\nPassing self.tokens[%d] = %s",
-                          self.token_index, self.tokens[self.token_index])
-            await self._get_tag()
+        while self.token_index < len(self.tokens):
+            self._tag_until(min(self.token_index + TAG_NEXT_STEP, len(self.tokens)))
             yield self.token_index
 
-    async def tag(self, tokens: list[Token]) -> tuple[dict[str, TaggerRule], list[TaggerTag]]:
-        # Several helper methods need access to the tokens.
+    async def tag_next(self, tokens: Sequence[Token]) -> int:
+        """
+        Tag the next token, yielding the token index reached.  This tags
+        in place, so a tagger that is shared should be stepped through
+        one of its contexts (see context()).
+        """
+        if self.resolves_synchronously:
+            for token_index in self.tag_next_sync(tokens):
+                yield token_index
+            return
         self.reset()
         self.tokens = tokens
-        # Loop through the tokens and tag them.
-        while (self.token_index < len(self.tokens) and
-               self.token_index is not None):
-            logging.debug("\nPassing self.tokens[%d] = %s",
-                          self.token_index, self.tokens[self.token_index])
-            await self._get_tag()
-        # All done, so let's do some cleanup.
-        rules = self.rules
-        tags = self.tags
-        # Clear this instance's tokens, rules, and tags.
-        # (This is an attempt to free up memory a bit earlier.)
-        self.reset()
-        # Return the goods.
-        return rules, tags
+        try:
+            await self.prepare()
+            if self.paragraph_concurrency > 1:
+                async for token_index in self._tag_paragraphs():
+                    yield token_index
+            while (self.token_index < len(self.tokens) and
+                   self.token_index is not None):
+                logging.debug("\nPassing self.tokens[%d] = %s",
+                              self.token_index, self.tokens.strings_of(self.token_index))
+                await self._get_tag()
+                yield self.token_index
+        finally:
+            await self.finish()
+
+    async def tag_context(self, tokens: Sequence[Token]) -> 'DocuscopeTaggerBase':
+        """
+        Tag tokens in a new context (see context()) and return it; its
+        rules, tags and backend are the results.
+        """
+        if self.resolves_synchronously:
+            return self.tag_context_sync(tokens)
+        context = self.context()
+        async for _ in context.tag_next(tokens):
+            pass
+        return context
+
+    def tag_context_sync(self, tokens: Sequence[Token]) -> 'DocuscopeTaggerBase':
+        """
+        tag_context without an event loop, e.g. in a worker thread or
+        process, for taggers that resolve their rules synchronously.
+        """
+        if not self.resolves_synchronously:
+            raise ValueError(f"{type(self).__name__} does not resolve its rules synchronously.")
+        context = self.context()
+        for _ in context.tag_next_sync(tokens):
+            pass
+        return context
+
+    async def tag(self, tokens: Sequence[Token]) -> tuple[dict[str, TaggerRule], TagStore]:
+        context = await self.tag_context(tokens)
+        return context.rules, context.tags
 
 
 def rule_applies_for_tokens(rule: list[str], tokens: list[set[str]],
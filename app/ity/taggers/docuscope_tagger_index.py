@@ -0,0 +1,39 @@
+""" The DocuScope Tagger using a local compiled rule index. """
+# coding=utf-8
+from typing import Optional
+
+from .docuscope_tagger_base import DocuscopeTaggerBase, LatRule
+from .lat_rule_index import LatRuleIndex
+from .rule_starts import RuleStarts
+
+
+class DocuscopeTaggerIndex(DocuscopeTaggerBase):
+    """
+    This DocuScope tagger walks a LatRuleIndex exported from the neo4j
+    rule graph instead of querying the database for every token.
+    """
+
+    def __init__(
+            self, *args,
+            wordclasses: Optional[dict[str, list[str]]] = None,
+            rule_index: Optional[LatRuleIndex] = None,
+            **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wordclasses = wordclasses or {}
+        self.rule_index = rule_index or LatRuleIndex()
+        self._label = (self._label if self._label else "") + ".default"
+
+    def find_long_rule(self) -> Optional[LatRule]:
+        return self.rule_index.get_long_rule(
+            self._iter_next_ds_word_ids(self.rule_index.word_ids))
+
+    @property
+    def _rule_starts(self) -> Optional[RuleStarts]:
+        return self.rule_index.rule_starts()
+
+    def _fork(self) -> 'DocuscopeTaggerIndex':
+        self._resolve_ds_word_ids(self.rule_index.word_ids)  # shared with the workers
+        return super()._fork()
+
+    def find_short_rule(self, token_ds_words: list[str]):
+        return self.rule_index.get_short_rule(token_ds_words)
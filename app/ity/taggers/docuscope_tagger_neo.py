@@ -2,76 +2,671 @@
 # coding=utf-8
 __author__ = 'mringenb'
 
+import asyncio
 import hashlib
-import json
+import logging
+from collections import Counter, defaultdict
+from collections.abc import Sequence
+from dataclasses import dataclass, field
+from functools import partial
+from time import perf_counter
 from typing import Optional
 
 import aiomcache
 import neo4j
 from neo4j import AsyncTransaction
 
+from ..tokenizers.tokenizer import Token
+from .circuit_breaker import BACKEND_FAILURES, CircuitBreaker, CircuitOpenError
 from .docuscope_tagger_base import (DocuscopeTaggerBase, LatRule,
                                     rule_applies_for_tokens)
+from .lat_rule_index import MAX_RULE_LENGTH, LatRuleIndex, best_short_rule
+from .rule_cache import (COMPRESS_THRESHOLD, CacheWriter, LocalRuleCache,
+                         LookupStats, SingleFlight, cache_key, decode_rules,
+                         decode_short_rule, encode_rules, encode_short_rule)
 
+Window = tuple[tuple[str, ...], ...]  # sorted wordclasses of consecutive tokens
+StartBigrams = dict[str, frozenset[str]]  # first word -> second words of rules
+RuleDepths = dict[tuple[str, str], int]  # (first, second) -> length of its longest rule
+ShortRules = dict[str, str]  # word -> lat of its unigram rule
+CACHE_MODES = ("window", "family", "best")
+# Errors of the rule backend that are handled by failing over to the fallback.
+BACKEND_ERRORS = (*BACKEND_FAILURES, CircuitOpenError, asyncio.TimeoutError)
 
-class DocuscopeTaggerNeo(DocuscopeTaggerBase):
+
+@dataclass
+class RulePlan:  # pylint: disable=too-many-instance-attributes
+    """Rule lookups of a document resolved ahead of the tagging loop."""
+    # keyed by lookup window, or by ((first,), (second,)) in "family" mode,
+    # or by the lookahead as far as its rules reach in "best" mode
+    long_rules: dict[Window, list[LatRule]] = field(default_factory=dict)
+    short_rules: dict[tuple[str, ...], tuple[Optional[str], Optional[str]]] = \
+        field(default_factory=dict)
+    positions: int = 0  # number of token positions scanned
+    queries: int = 0  # number of batched queries sent to neo4j
+    transactions: int = 0  # number of read transactions
+    acquire_seconds: float = 0  # time spent waiting for a connection
+    max_acquire_seconds: float = 0
+    cache_requests: int = 0  # number of memcache multi-gets
+    cache_lookups: int = 0  # lookups looked for in the caches
+    cache_hits: int = 0  # lookups resolved by either cache tier
+    filtered: int = 0  # long rule lookups skipped by the start bigram filter
+
+    def report(self) -> dict[str, float]:
+        """Summary of the resolution work for this document."""
+        return {"positions": self.positions,
+                "windows": len(self.long_rules),
+                "short_windows": len(self.short_rules),
+                "queries": self.queries,
+                "transactions": self.transactions,
+                "acquire_seconds": self.acquire_seconds,
+                "max_acquire_seconds": self.max_acquire_seconds,
+                "cache_requests": self.cache_requests,
+                "cache_lookups": self.cache_lookups,
+                "cache_hits": self.cache_hits,
+                "filtered": self.filtered}
+
+
+class DocuscopeTaggerNeo(DocuscopeTaggerBase):  # pylint: disable=too-many-instance-attributes
     """
     This DocuScope tagger connects to a neo4j database which stores all of the
     LAT rules and patterns.
+
+    Unless plan_lookups is False, every distinct lookup window in the
+    document is resolved before tagging (see prepare()): first from the
+    caches and then in a few batched queries, so that the tagging loop
+    itself does not wait on neo4j.  Otherwise, the lookups of the next
+    prefetch_size positions are fetched from the caches in one multi-get
+    whenever the tagging loop reaches positions that have not been staged.
+
+    Lookups are cached in memcache (cache) and, if given, in a longer lived
+    in-process tier (local_cache) that is checked first.  If there is a
+    cache_writer, new memcache entries are written behind through it
+    instead of being waited on.  Values of more than compress_threshold
+    bytes are compressed.  Cache keys are prefixed with cache_namespace,
+    which should identify the dictionary version so that entries for
+    different versions never collide.
+
+    If start_bigrams (see get_start_bigrams) is given, long rule lookups
+    whose first two tokens cannot start a rule are skipped without any I/O.
+    If short_rules (see get_short_rule_table) is given, unigram rules are
+    looked up in it instead of in the caches and neo4j.
+
+    In the default "window" cache_mode, long rules are looked up and cached
+    by the wordclasses of the next four tokens.  In "family" mode they are
+    looked up and cached by each (first, second) word pair that the first
+    two tokens can start, keeping every rule of that family, so one entry
+    serves all of the continuations and rule_applies_for_tokens does the
+    rest of the matching.  In "best" mode the wordclasses of the lookahead
+    are sent instead and neo4j returns only the longest rule that applies,
+    along with the unigram rule of the first token unless short_rules is
+    given, so that neither rule matching nor a separate short rule lookup
+    is left to do.  The lookahead reaches as far as the longest rule
+    starting with its first two tokens (see get_rule_depths;
+    MAX_RULE_LENGTH tokens if rule_depths is not given) and stops before
+    any token without wordclasses, since no rule gets past it.  Cache hit rates are added to lookup_stats.
+
+    If there is a surface_cache, the resulting long rule of a position is
+    also cached by the lowercased text of its tokens, so that frequent
+    phrases skip wordclass expansion and rule matching altogether.
+
+    Queries for lookups that another tagger sharing single_flight is
+    already querying wait for that result instead of being sent again.
+    All of the queries for a document are sent through one session, up to
+    batch_size lookups per read transaction.
+
+    Queries go through circuit_breaker, if given, so that a stalled or
+    failing neo4j is cut off instead of waited on.  When a lookup fails
+    and there is a fallback rule index (see LatRuleIndex.from_dictionary),
+    the rest of the document is tagged from it; backend tells which rule
+    sources produced the tags.
     """
 
-    def __init__(
+    def __init__(  # pylint: disable=too-many-arguments,too-many-locals
             self, *args,
             wordclasses: Optional[dict[str, list[str]]] = None,
             driver: Optional[neo4j.AsyncDriver] = None,
             cache: Optional[aiomcache.Client] = None,
+            local_cache: Optional[LocalRuleCache] = None,
+            cache_writer: Optional[CacheWriter] = None,
+            compress_threshold: int = COMPRESS_THRESHOLD,
+            cache_namespace: str = "",
+            start_bigrams: Optional[StartBigrams] = None,
+            short_rules: Optional[ShortRules] = None,
+            rule_depths: Optional[RuleDepths] = None,
+            cache_mode: str = "window",
+            lookup_stats: Optional[LookupStats] = None,
+            surface_cache: Optional[LocalRuleCache] = None,
+            single_flight: Optional[SingleFlight] = None,
+            plan_lookups: bool = True,
+            batch_size: int = 500,
+            prefetch_size: int = 100,
+            circuit_breaker: Optional[CircuitBreaker] = None,
+            fallback: Optional[LatRuleIndex] = None,
             **kwargs):
         super().__init__(*args, **kwargs)
         self.driver = driver
         self.wordclasses = wordclasses or {}
         self._label = (self._label if self._label else "") + ".default"
         self.cache = cache
+        self.local_cache = local_cache
+        self.cache_writer = cache_writer
+        self.compress_threshold = compress_threshold
+        self.cache_namespace = cache_namespace
+        self.start_bigrams = start_bigrams
+        self.short_rules = short_rules
+        self.rule_depths = rule_depths
+        if cache_mode not in CACHE_MODES:
+            raise ValueError(f"Unknown cache_mode: {cache_mode}")
+        self.cache_mode = cache_mode
+        # "best" mode lookups also fetch the unigram rule unless it is resident
+        self._fuse_short = cache_mode == "best" and short_rules is None
+        self.lookup_stats = lookup_stats
+        self.surface_cache = surface_cache
+        self.single_flight = single_flight or SingleFlight()
+        self.plan_lookups = plan_lookups
+        self.batch_size = batch_size
+        self.prefetch_size = prefetch_size
+        self.plan = RulePlan()
+        self._staged_until = 0  # token index up to which lookups are staged
+        self._session: Optional[neo4j.AsyncSession] = None  # of the current document
+        self._fetches: set[asyncio.Task] = set()  # tasks using self._session
+        # (token index, (lat, word)) of the unigram rule fetched with the
+        # long rule lookup of that position in "best" mode
+        self._fused_short: Optional[tuple[int, tuple[Optional[str], Optional[str]]]] = None
+        self.circuit_breaker = circuit_breaker
+        self.fallback = fallback
+        self.backends: list[str] = []  # rule sources used for the current document
+        self._failed_over = False
+
+    @property
+    def resolves_synchronously(self) -> bool:
+        return False
+
+    @property
+    def backend(self) -> str:
+        """The rule sources that produced the tags, "neo4j" and/or "local"."""
+        return "+".join(self.backends)
+
+    def _use_backend(self, name: str) -> None:
+        if name not in self.backends:
+            self.backends.append(name)
+
+    def _fail_over(self, exc: Exception) -> None:
+        """Look up the rest of the document's rules in the fallback index."""
+        logging.warning("Rule backend unavailable (%s), using the local rules from token %d.",
+                        exc or type(exc).__name__, self.token_index)
+        self._failed_over = True
+
+    def _long_lookup(self, width: int = 4) -> list[list[str]]:
+        """The sorted wordclasses of the next width tokens used to query long rules."""
+        return [sorted(list(t))
+                for t in self.get_next_ds_words_in_range(0, width)]
+
+    def _may_start_rule(self, lookup: list[list[str]]) -> bool:
+        """False if no rule starts with the first two wordclass sets of lookup."""
+        if not lookup[0] or not lookup[1]:
+            return False
+        if self.start_bigrams is None:
+            return True
+        return any(not self.start_bigrams.get(first, frozenset()).isdisjoint(lookup[1])
+                   for first in lookup[0])
+
+    def _long_lookups(self, lookup: list[list[str]]) -> dict[Window, list[list[str]]]:
+        """The lookups, by window, needed for the long rules of lookup in cache_mode."""
+        if self.cache_mode == "window":
+            return {tuple(map(tuple, lookup)): lookup}
+        if self.cache_mode == "best":
+            lookahead = self._best_lookahead(lookup)
+            return {tuple(map(tuple, lookahead)): lookahead}
+        return {((first,), (second,)): [[first], [second]]
+                for first in lookup[0]
+                for second in lookup[1]
+                if self.start_bigrams is None or
+                second in self.start_bigrams.get(first, frozenset())}
+
+    def _best_lookahead(self, lookup: list[list[str]]) -> list[list[str]]:
+        """
+        The wordclasses of the next tokens that the rules starting with the
+        first two of lookup can reach: up to the longest of those rules and
+        before the first token without wordclasses.
+        """
+        depth = MAX_RULE_LENGTH
+        if self.rule_depths is not None:
+            depth = max((self.rule_depths.get((first, second), 2)
+                         for first in lookup[0] for second in lookup[1]), default=2)
+        lookahead = lookup[:depth] if depth <= len(lookup) else self._long_lookup(depth)
+        return lookahead[:next((index for index, words in enumerate(lookahead) if not words),
+                               len(lookahead))]
+
+    def _long_key(self, lookup: list[list[str]]) -> bytes:
+        """Cache key for a long rule lookup window."""
+        kind = self.cache_mode
+        if kind == "best" and not self._fuse_short:  # entries without the unigram rule
+            kind = "best-long"
+        return cache_key(self.cache_namespace, kind, lookup)
+
+    def _short_key(self, token_ds_words: list[str]) -> bytes:
+        """Cache key for a short rule lookup."""
+        return cache_key(self.cache_namespace, "short", [sorted(token_ds_words)])
+
+    def _collect_lookups(
+            self, start: int = 0, limit: Optional[int] = None,
+            long_counts: Optional[Counter] = None, short_counts: Optional[Counter] = None
+    ) -> tuple[dict[Window, list[list[str]]], dict[tuple[str, ...], list[str]], int]:
+        """
+        Gather the distinct lookups that have not been staged for up to limit
+        included positions starting at token index start.  The occurrences
+        of each window are added to long_counts and short_counts, if given.
+
+        :return: the long rule lookups, the short rule lookups, and the
+                 token index following the last position scanned.
+        """
+        long_lookups: dict[Window, list[list[str]]] = {}
+        short_lookups: dict[tuple[str, ...], list[str]] = {}
+        current_index = self.token_index
+        token_index = start
+        positions = 0
+        while token_index < len(self.tokens) and (limit is None or positions < limit):
+            if self.tokens.type_of(token_index) not in self.excluded_token_types:
+                positions += 1
+                self.token_index = token_index
+                fused = self._collect_long_lookups(long_lookups, long_counts)
+                if self.short_rules is None and not fused:  # else resident or fused
+                    ds_words = self._get_ds_words_for_token_index(token_index)
+                    short_window = tuple(sorted(ds_words))
+                    if ds_words and short_counts is not None:
+                        short_counts[short_window] += 1
+                    if ds_words and short_window not in self.plan.short_rules:
+                        short_lookups.setdefault(short_window, ds_words)
+            token_index += 1
+        self.token_index = current_index
+        self.plan.positions += positions
+        return long_lookups, short_lookups, token_index
+
+    def _collect_long_lookups(
+            self, long_lookups: dict[Window, list[list[str]]],
+            long_counts: Optional[Counter] = None) -> bool:
+        """
+        Add the long rule lookups of the current position that have not been
+        staged to long_lookups, counting them in long_counts, if given.
+
+        :return: True if the unigram rule comes with the long rule lookup.
+        """
+        if self._get_nth_next_included_token_index() is None:
+            return False
+        lookup = self._long_lookup()
+        if not self._may_start_rule(lookup):
+            return False
+        for window, long_lookup in self._long_lookups(lookup).items():
+            if long_counts is not None:
+                long_counts[window] += 1
+            if window not in self.plan.long_rules:
+                long_lookups.setdefault(window, long_lookup)
+        return self._fuse_short
+
+    async def _stage_cached(
+            self,
+            long_lookups: dict[Window, list[list[str]]],
+            short_lookups: dict[tuple[str, ...], list[str]]) -> None:
+        """
+        Move the lookups that are in the in-process tier or in memcache into
+        self.plan.  Memcache is queried with one multi-get per batch_size keys.
+        Resolved lookups are removed from long_lookups and short_lookups.
+        """
+        for kind, lookups, staged, cache_key_for, decode in (
+                (self.cache_mode, long_lookups, self.plan.long_rules,
+                 self._long_key, decode_rules),
+                ("short", short_lookups, self.plan.short_rules,
+                 self._short_key, decode_short_rule)):
+            keys = {window: cache_key_for(lookup) for window, lookup in lookups.items()}
+            requested = len(keys)
+            local_hits = memcache_hits = 0
+            if self.local_cache is not None:
+                for window, key in list(keys.items()):
+                    value = self.local_cache.get(key)
+                    if value is not None:
+                        staged[window] = value
+                        del lookups[window], keys[window]
+                        local_hits += 1
+            if self.cache:
+                memcache_hits = await self._stage_memcached(keys, lookups, staged, decode)
+            self.plan.cache_lookups += requested
+            self.plan.cache_hits += local_hits + memcache_hits
+            if self.lookup_stats is not None and requested:
+                self.lookup_stats.add(kind, lookups=requested, local_hits=local_hits,
+                                      memcache_hits=memcache_hits)
+
+    async def _stage_memcached(self, keys: dict, lookups: dict, staged: dict, decode) -> int:
+        """
+        Move the lookups whose keys are in memcache from lookups into staged,
+        and into the in-process tier, with one multi-get per batch_size keys.
+
+        :return: the number of lookups found.
+        """
+        found = 0
+        for batch in _batched(list(keys.items()), self.batch_size):
+            hits = await self.cache.multi_get(*(key for _, key in batch))
+            self.plan.cache_requests += 1
+            for (window, key), hit in zip(batch, hits):
+                if hit is None:
+                    continue
+                value = decode(hit)
+                if self.local_cache is not None:
+                    self.local_cache.set(key, value, len(hit))
+                staged[window] = value
+                del lookups[window]
+                found += 1
+        return found
+
+    async def _cache_set(self, kind: str, key: bytes, value, encode,
+                         inline: bool = True) -> None:
+        """
+        Store a value of the given kind of lookup in the in-process tier and
+        in memcache.  The memcache write is queued on the cache writer if
+        there is one, otherwise it is awaited unless inline is False.
+        """
+        if not self.cache and self.local_cache is None:
+            return
+        if self.lookup_stats is not None:
+            self.lookup_stats.add(kind, stored=1)
+        payload = encode(value, self.compress_threshold)
+        if self.local_cache is not None:
+            self.local_cache.set(key, value, len(payload))
+        if self.cache_writer is not None:
+            self.cache_writer.put(key, payload)
+        elif self.cache and inline:
+            await self.cache.set(key, payload)
+
+    async def _query_rules(self, kind: str, lookups: dict, inline: bool = True) -> None:
+        """
+        Resolve lookups of the given kind ("short" or the cache_mode) in
+        neo4j, in batches, caching the results and adding them to self.plan.
+        """
+        if kind == "short":
+            cache_key_for, query, encode = \
+                self._short_key, get_short_rules_batch, encode_short_rule
+            staged = self.plan.short_rules
+        else:
+            cache_key_for, encode = self._long_key, encode_rules
+            query = {"family": get_rule_families_batch,
+                     "best": partial(get_best_rules_batch, with_short_rule=self._fuse_short)
+                     }.get(kind, get_lat_rules_batch)
+            staged = self.plan.long_rules
+
+        async def fetch(items: list[tuple[bytes, list]]) -> list:
+            results = await self._read(kind, query, [lookup for _, lookup in items])
+            self.plan.queries += len({len(lookup) for _, lookup in items}) \
+                if query is get_lat_rules_batch else 1
+            for (key, _), result in zip(items, results):
+                await self._cache_set(kind, key, result, encode, inline=inline)
+            return results
+
+        for batch in _batched(list(lookups.items()), self.batch_size):
+            results = await self.single_flight.run(
+                [(cache_key_for(lookup), lookup) for _, lookup in batch], fetch)
+            for (window, _), result in zip(batch, results):
+                staged[window] = result
+
+    async def _read(self, kind: str, query, lookups: list) -> list:
+        """
+        Run query for lookups in a read transaction of the document's
+        session, recording how long it waited to acquire a connection.
+        """
+        task = asyncio.current_task()
+        self._fetches.add(task)
+        try:
+            if self._session is None:
+                self._session = self.driver.session()
+            start_time = perf_counter()
+            waits = []
+
+            async def work(trx: AsyncTransaction) -> list:
+                waits.append(perf_counter() - start_time)
+                return await query(trx, lookups)
+
+            if self.circuit_breaker is not None:
+                results = await self.circuit_breaker.call(
+                    lambda: self._session.execute_read(work), len(lookups))
+            else:
+                results = await self._session.execute_read(work)
+        finally:
+            self._fetches.discard(task)
+        self.plan.transactions += 1
+        self.plan.acquire_seconds += waits[0]
+        self.plan.max_acquire_seconds = max(self.plan.max_acquire_seconds, waits[0])
+        if self.lookup_stats is not None:
+            self.lookup_stats.add(kind, queries=1, acquire_seconds=waits[0])
+        return results
+
+    def context(self) -> 'DocuscopeTaggerNeo':
+        context = super().context()
+        context.plan = RulePlan()
+        context.backends = []
+        return context
+
+    def __copy__(self) -> 'DocuscopeTaggerNeo':
+        # Copies tag other documents or paragraphs concurrently, and sessions
+        # do not run concurrent transactions.
+        clone = type(self).__new__(type(self))
+        clone.__dict__.update(self.__dict__, _session=None, _fetches=set())
+        return clone
+
+    def _lookups_overlap(self) -> bool:
+        # Planned lookups are all resolved by prepare(), and the fallback
+        # resolves them synchronously.
+        return not self.plan_lookups and not self._failed_over
+
+    async def finish(self) -> None:
+        """Close the document's session once the queries using it are done."""
+        session, self._session = self._session, None
+        if session is None:
+            return
+        pending = [task for task in self._fetches if not task.done()]
+
+        async def close() -> None:
+            if pending:  # queries shared with other taggers, see SingleFlight
+                await asyncio.wait(pending)
+            try:
+                await session.close()
+            except BACKEND_ERRORS as exc:
+                logging.warning("Error closing neo4j session: %s", exc)
+
+        await asyncio.shield(asyncio.get_running_loop().create_task(close()))
+
+    async def prepare(self) -> None:
+        """Resolve the long and short rule lookups of every included position."""
+        self.plan = RulePlan()
+        self._staged_until = 0
+        self._fused_short = None
+        self.backends = []
+        self._failed_over = False
+        if self.fallback is not None and self.circuit_breaker is not None and \
+                not self.circuit_breaker.allow():
+            self._fail_over(CircuitOpenError("circuit open"))
+            return
+        if not self.plan_lookups:
+            return
+        long_lookups, short_lookups, self._staged_until = self._collect_lookups()
+        try:
+            await self._stage_cached(long_lookups, short_lookups)
+            await self._query_rules(self.cache_mode, long_lookups, inline=False)
+            await self._query_rules("short", short_lookups, inline=False)
+        except BACKEND_ERRORS as exc:
+            if self.fallback is None:
+                raise
+            self._fail_over(exc)
+            return
+        logging.info("Resolved %d unique windows and %d unigram lookups for %d positions "
+                     "in %d queries (%.3fs waiting for connections) and "
+                     "%d cache requests (%d hits).",
+                     len(self.plan.long_rules), len(self.plan.short_rules),
+                     self.plan.positions, self.plan.queries, self.plan.acquire_seconds,
+                     self.plan.cache_requests, self.plan.cache_hits)
+
+    def collect_lookups(
+            self, tokens: Sequence[Token],
+            long_counts: Optional[Counter] = None, short_counts: Optional[Counter] = None
+    ) -> tuple[dict[Window, list[list[str]]], dict[tuple[str, ...], list[str]]]:
+        """
+        The distinct long and short rule lookups that tagging tokens would
+        need, counting their occurrences in long_counts and short_counts.
+        Like tag_next, this works in place, so use it on a context() of a
+        shared tagger.
+        """
+        self.reset()
+        self.tokens = tokens
+        long_lookups, short_lookups, _ = self._collect_lookups(
+            long_counts=long_counts, short_counts=short_counts)
+        return long_lookups, short_lookups
+
+    async def warm(self, long_lookups: dict[Window, list[list[str]]],
+                   short_lookups: dict[tuple[str, ...], list[str]]) -> int:
+        """
+        Resolve lookups gathered by collect_lookups into the caches without
+        tagging anything.  This works in place, like collect_lookups.
+
+        :return: the number of lookups that were not cached and were queried.
+        """
+        long_lookups, short_lookups = dict(long_lookups), dict(short_lookups)
+        self.plan = RulePlan()
+        try:
+            await self._stage_cached(long_lookups, short_lookups)
+            await self._query_rules(self.cache_mode, long_lookups)
+            await self._query_rules("short", short_lookups)
+        finally:
+            await self.finish()
+        return len(long_lookups) + len(short_lookups)
+
+    async def _prefetch(self) -> None:
+        """Stage the cached lookups of the next prefetch_size positions."""
+        if self.token_index < self._staged_until or \
+                (not self.cache and self.local_cache is None):
+            return
+        long_lookups, short_lookups, self._staged_until = self._collect_lookups(
+            self.token_index, self.prefetch_size)
+        await self._stage_cached(long_lookups, short_lookups)
+
+    def _surface_key(self, width: int) -> tuple:
+        """Key of the lowercased text of the next width included tokens."""
+        return (self.cache_namespace, width,
+                *("\x1f".join(self.tokens.strings_of(index)).lower()
+                  for index in self._get_next_token_indexes_in_range(0, width)))
 
     async def get_long_rule(self) -> Optional[LatRule]:
-        lookup = [sorted(list(t))
-                  for t in self.get_next_ds_words_in_range(0, 4)]
-        rules: Optional[list[LatRule]] = None
-        if self.cache:
-            hsh = hashlib.sha256(str(lookup).encode(
-                'utf-8')).hexdigest().encode('utf-8')
-            hit = await self.cache.get(hsh)
-            if hit is not None:
-                rules = json.loads(hit)
-        if rules is None:
-            async with self.driver.session() as session:
-                rules = await session.execute_read(
-                    get_lat_rules, lookup)
-        if rules and self.cache:
-            jrules = json.dumps(rules)
-            await self.cache.set(hsh, jrules.encode('utf-8'))
+        if not self._failed_over:
+            try:
+                ds_rule = await self._get_long_rule()
+                self._use_backend("neo4j")
+                return ds_rule
+            except BACKEND_ERRORS as exc:
+                if self.fallback is None:
+                    raise
+                self._fail_over(exc)
+        self._use_backend("local")
+        return self.fallback.get_long_rule(self._iter_next_ds_word_ids(self.fallback.word_ids))
+
+    async def _get_long_rule(self) -> Optional[LatRule]:
+        """Look up the long rule in the caches and neo4j."""
+        if self.surface_cache is None:
+            ds_rule, _ = await self._match_long_rule()
+            return ds_rule
+        # The result depends on the tokens up to its horizon, which only
+        # depends on the first four.  Longer horizons need a second entry.
+        key = self._surface_key(4)
+        entry = self.surface_cache.get(key)
+        if entry is not None and entry[0] > 4:
+            entry = self.surface_cache.get(self._surface_key(entry[0]))
+        if entry is not None:
+            if entry[2] is not None:
+                self._fused_short = (self.token_index, entry[2])
+            return entry[1]
+        ds_rule, horizon = await self._match_long_rule()
+        entry = (horizon, ds_rule, self._current_fused_short())
+        self.surface_cache.set(key, entry, 0)
+        if horizon > 4:
+            self.surface_cache.set(self._surface_key(horizon), entry, 0)
+        return ds_rule
+
+    async def _match_long_rule(self) -> tuple[Optional[LatRule], int]:
+        """
+        Find the longest applicable rule at the current position.
+
+        :return: the rule, or None, and the number of included tokens that
+                 the result depends on.
+        """
+        lookup = self._long_lookup()
+        if not self._may_start_rule(lookup):
+            self.plan.filtered += 1
+            return None, len(lookup)
+        await self._prefetch()
+        long_lookups = self._long_lookups(lookup)
+        missing = {window: long_lookup for window, long_lookup in long_lookups.items()
+                   if window not in self.plan.long_rules}
+        if missing:
+            await self._query_rules(self.cache_mode, missing)
+        if self.cache_mode == "best":  # matched by neo4j, see get_best_rules_batch
+            [(window, rules)] = [(window, self.plan.long_rules[window])
+                                 for window in long_lookups]
+            if self._fuse_short:
+                self._fused_short = (self.token_index, next(
+                    ((rule['lat'], rule['path'][0]) for rule in rules
+                     if len(rule['path']) == 1), (None, None)))
+            return next((rule for rule in rules if len(rule['path']) > 1), None), len(window)
+        rules = [rule for window in long_lookups for rule in self.plan.long_rules[window]]
+        if len(long_lookups) > 1:  # merge rule families, longest first
+            rules.sort(key=lambda rule: len(rule['path']), reverse=True)
         tokens = self.get_next_ds_words_in_range(
             0, len(rules[0]['path'])) if len(rules) > 0 else []
         ds_rule = next((r for r in rules
                         if rule_applies_for_tokens(r['path'], tokens, offset=2)), None)
-        return ds_rule
+        return ds_rule, max(len(lookup), len(rules[0]['path']) if rules else 0)
+
+    def _current_fused_short(self) -> Optional[tuple[Optional[str], Optional[str]]]:
+        """The unigram rule fetched with the current position's long rule, if any."""
+        if self._fused_short is not None and self._fused_short[0] == self.token_index:
+            return self._fused_short[1]
+        return None
 
     async def get_short_rule(self, token_ds_words: list[str]):
         if len(token_ds_words) == 0:
             return None, None
-        if self.cache:
-            hsh = hashlib.sha256(str(sorted(token_ds_words)).encode('utf-8'))\
-                .hexdigest().encode('utf-8')
-            hit = await self.cache.get(hsh)
-            if hit is not None:
-                [lat, token] = json.loads(hit)
-                return lat, token
-        async with self.driver.session() as session:
-            lat, token = await session.execute_read(get_short_rules, token_ds_words)
-        if self.cache:
-            await self.cache.set(hsh, json.dumps([lat, token]).encode("utf-8"))
+        if self.short_rules is not None:
+            return best_short_rule(self.short_rules, token_ds_words)
+        if not self._failed_over:
+            try:
+                rule = await self._get_short_rule(token_ds_words)
+                self._use_backend("neo4j")
+                return rule
+            except BACKEND_ERRORS as exc:
+                if self.fallback is None:
+                    raise
+                self._fail_over(exc)
+        self._use_backend("local")
+        return self.fallback.get_short_rule(token_ds_words)
+
+    async def _get_short_rule(self, token_ds_words: list[str]) -> tuple[Optional[str],
+                                                                       Optional[str]]:
+        """Look up the unigram rule in the caches and neo4j."""
+        fused = self._current_fused_short()
+        if fused is not None:
+            return fused
+        window = tuple(sorted(token_ds_words))
+        await self._prefetch()
+        rule = self.plan.short_rules.get(window)
+        if rule is None:
+            await self._query_rules("short", {window: token_ds_words})
+            rule = self.plan.short_rules[window]
+        lat, token = rule
         return lat, token
 
 
+def _batched(items: list, size: int):
+    """Split items into lists of at most size elements."""
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
 async def get_lat_rules(
         trx: AsyncTransaction,
         tokens: list[tuple[str]]) -> list[LatRule]:
@@ -133,3 +728,245 @@ async def get_short_rules(trx: AsyncTransaction,
     if result:
         return result["lat"], result["token"]
     return None, None
+
+
+async def get_lat_rules_batch(
+        trx: AsyncTransaction,
+        lookups: list[list[list[str]]]) -> list[list[LatRule]]:
+    """ Retrieve the LAT rules for several n-grams at once (see get_lat_rules). """
+    by_size: dict[int, list[dict]] = defaultdict(list)
+    for lookup_id, tokens in enumerate(lookups):
+        by_size[min(len(tokens), 4)].append(
+            dict(zip(["id", "first", "second", "third", "fourth"],
+                     [lookup_id, *tokens])))
+    results: list[list[LatRule]] = [[] for _ in lookups]
+    for size, batch in by_size.items():
+        if size >= 4:
+            result = await trx.run(
+                "UNWIND $lookups AS lookup "
+                "MATCH (w1:Start)-[w2:NEXT]->(e2) "
+                "WHERE w1.word IN lookup.first AND w2.word IN lookup.second "
+                "CALL { "
+                "  WITH e2, lookup MATCH (e2)-[w3:NEXT]->(e3) WHERE w3.word IN lookup.third "
+                "  CALL {"
+                "    WITH e3, lookup "
+                "    MATCH r = (e3)-[w4:NEXT]->()-[:NEXT*0..23]->()-[:LAT]->(l:Lat) "
+                "    WHERE w4.word IN lookup.fourth "
+                "    RETURN [p IN relationships(r) WHERE p.word IS NOT NULL | p.word] AS path, "
+                "      l.lat AS lat ORDER BY length(r) DESC "
+                "    UNION ALL "
+                "    WITH e3 MATCH (e3)-[:LAT]->(l:Lat) "
+                "    RETURN [] AS path, l.lat AS lat LIMIT 1 "
+                "  } "
+                "  RETURN [w3.word] + path AS path, lat "
+                "  UNION ALL "
+                "  WITH e2 MATCH (e2)-[:LAT]->(l:Lat) "
+                "  RETURN [] AS path, l.lat AS lat LIMIT 1 "
+                "} "
+                "RETURN lookup.id AS id, [w1.word, w2.word] + path AS path, lat",
+                lookups=batch)
+        elif size == 3:
+            result = await trx.run(
+                "UNWIND $lookups AS lookup "
+                "MATCH (w1:Start)-[w2:NEXT]->(e2) "
+                "WHERE w1.word IN lookup.first AND w2.word IN lookup.second "
+                "CALL { "
+                "  WITH e2, lookup MATCH (e2)-[w3:NEXT]->()-[:LAT]->(l:Lat) "
+                "  WHERE w3.word IN lookup.third "
+                "  RETURN [w3.word] AS word3, l.lat AS lat LIMIT 1 "
+                "  UNION ALL "
+                "  WITH e2 MATCH (e2)-[:LAT]->(l:Lat) "
+                "  RETURN [] AS word3, l.lat AS lat LIMIT 1 "
+                "} "
+                "RETURN lookup.id AS id, [w1.word, w2.word] + word3 AS path, lat",
+                lookups=batch)
+        else:  # bigram fallthrough
+            result = await trx.run(
+                "UNWIND $lookups AS lookup "
+                "CALL { "
+                "  WITH lookup MATCH (w1:Start)-[w2:NEXT]->()-[:LAT]->(l:Lat) "
+                "  WHERE w1.word IN lookup.first AND w2.word IN lookup.second "
+                "  RETURN [w1.word, w2.word] AS path, l.lat AS lat LIMIT 1 "
+                "} "
+                "RETURN lookup.id AS id, path, lat",
+                lookups=batch)
+        async for record in result:
+            results[record["id"]].append({"lat": record["lat"],
+                                          "path": record["path"]})
+    for rules in results:
+        # stable sort to match get_lat_rules' ORDER BY size(path) DESC
+        rules.sort(key=lambda rule: len(rule['path']), reverse=True)
+    return results
+
+
+async def get_rule_families_batch(
+        trx: AsyncTransaction,
+        lookups: list[list[list[str]]]) -> list[list[LatRule]]:
+    """
+    Retrieve every long LAT rule starting with each [[first], [second]] word
+    pair, longest first.
+    """
+    result = await trx.run(
+        "UNWIND $lookups AS lookup "
+        "MATCH r = (s:Start)-[n:NEXT]->()-[:NEXT*0..25]->()-[:LAT]->(l:Lat) "
+        "WHERE s.word = lookup.first AND n.word = lookup.second "
+        "RETURN lookup.id AS id, "
+        "  [s.word] + [p IN relationships(r) WHERE p.word IS NOT NULL | p.word] AS path, "
+        "  l.lat AS lat",
+        lookups=[{"id": lookup_id, "first": first, "second": second}
+                 for lookup_id, ([first], [second]) in enumerate(lookups)])
+    results: list[list[LatRule]] = [[] for _ in lookups]
+    async for record in result:
+        results[record["id"]].append({"lat": record["lat"],
+                                      "path": record["path"]})
+    for rules in results:
+        rules.sort(key=lambda rule: len(rule['path']), reverse=True)
+    return results
+
+
+async def get_best_rules_batch(
+        trx: AsyncTransaction,
+        lookups: list[list[list[str]]],
+        with_short_rule: bool = True) -> list[list[LatRule]]:
+    """
+    Retrieve, for each lookahead window of wordclass sets, the longest rule
+    that applies to the window and, if with_short_rule, the unigram rule of
+    its first token (see get_short_rules) in one round trip.  The unigram
+    rule, if any, is the rule with a one word path.
+    """
+    # The rule prefixes that match the window are extended one token at a
+    # time, so that only the branches of the rule tree that the window
+    # follows are expanded.
+    result = await trx.run(
+        "UNWIND $lookups AS lookup "
+        "CALL { "
+        "  WITH lookup MATCH (w1:Start)-[w2:NEXT]->(e2) "
+        "  WHERE w1.word IN lookup.window[0] AND w2.word IN lookup.window[1] "
+        "  WITH lookup, reduce(prefixes = [{node: e2, path: [w1.word, w2.word]}], "
+        "    i IN range(2, size(lookup.window) - 1) | prefixes + reduce(found = [], "
+        "      prefix IN [p IN prefixes WHERE size(p.path) = i] | found + "
+        "        [n IN [prefix.node] | [(n)-[w:NEXT]->(m) WHERE w.word IN lookup.window[i] "
+        "          | {node: m, path: prefix.path + w.word}]][0])) AS prefixes "
+        "  UNWIND prefixes AS prefix "
+        "  WITH prefix.node AS node, prefix.path AS path "
+        "  MATCH (node)-[:LAT]->(l:Lat) "
+        "  RETURN path, l.lat AS lat ORDER BY size(path) DESC LIMIT 1 "
+        + ("  UNION ALL "
+           "  WITH lookup MATCH (s:Start)-[:LAT]->(l:Lat) WHERE s.word IN lookup.window[0] "
+           "  RETURN [s.word] AS path, l.lat AS lat ORDER BY path[0] DESC, lat DESC LIMIT 1 "
+           if with_short_rule else "") +
+        "} "
+        "RETURN lookup.id AS id, path, lat",
+        lookups=[{"id": lookup_id, "window": window}
+                 for lookup_id, window in enumerate(lookups)])
+    results: list[list[LatRule]] = [[] for _ in lookups]
+    async for record in result:
+        results[record["id"]].append({"lat": record["lat"],
+                                      "path": record["path"]})
+    for rules in results:
+        rules.sort(key=lambda rule: len(rule['path']), reverse=True)
+    return results
+
+
+async def get_short_rules_batch(
+        trx: AsyncTransaction,
+        lookups: list[list[str]]) -> list[tuple[Optional[str], Optional[str]]]:
+    """ Retrieve the unigram LAT rules for several tokens at once (see get_short_rules). """
+    result = await trx.run(
+        "UNWIND $lookups AS lookup "
+        "CALL { "
+        "  WITH lookup MATCH (s:Start)-[:LAT]->(l:Lat) WHERE s.word IN lookup.first "
+        "  RETURN s.word AS token, l.lat AS lat "
+        "  ORDER BY token DESC, lat DESC LIMIT 1 "
+        "} "
+        "RETURN lookup.id AS id, token, lat",
+        lookups=[{"id": lookup_id, "first": first}
+                 for lookup_id, first in enumerate(lookups)])
+    rules: list[tuple[Optional[str], Optional[str]]] = [(None, None)] * len(lookups)
+    async for record in result:
+        rules[record["id"]] = (record["lat"], record["token"])
+    return rules
+
+
+async def get_start_bigrams(trx: AsyncTransaction) -> StartBigrams:
+    """ Retrieve the (first, second) word pairs that start a long LAT rule. """
+    result = await trx.run(
+        "MATCH (s:Start)-[n:NEXT]->() "
+        "RETURN s.word AS first, collect(DISTINCT n.word) AS second")
+    return {record["first"]: frozenset(record["second"])
+            async for record in result}
+
+
+async def get_rule_depths(trx: AsyncTransaction) -> RuleDepths:
+    """ Retrieve the length of the longest LAT rule starting with each word pair. """
+    result = await trx.run(
+        "MATCH (s:Start)-[n:NEXT]->(e2) "
+        "MATCH r = (e2)-[:NEXT*0..25]->()-[:LAT]->(:Lat) "
+        "RETURN s.word AS first, n.word AS second, max(length(r)) + 1 AS depth")
+    return {(record["first"], record["second"]): record["depth"]
+            async for record in result}
+
+
+async def get_short_rule_table(trx: AsyncTransaction) -> ShortRules:
+    """ Retrieve every unigram LAT rule, the greatest lat for each word. """
+    result = await trx.run(
+        "MATCH (s:Start)-[:LAT]->(l:Lat) "
+        "RETURN s.word AS token, max(l.lat) AS lat")
+    return {record["token"]: record["lat"] async for record in result}
+
+
+async def get_rule_graph_size(trx: AsyncTransaction) -> tuple[int, int, int]:
+    """ Count the NEXT and LAT relationships and the distinct lats of the rule graph. """
+    result = await trx.run(
+        "CALL { MATCH ()-[n:NEXT]->() RETURN count(n) AS next } "
+        "OPTIONAL MATCH ()-[:LAT]->(l:Lat) "
+        "RETURN next, count(l) AS rules, count(DISTINCT l.lat) AS lats")
+    record = await result.single()
+    return record["next"], record["rules"], record["lats"]
+
+
+def rule_graph_digest(start_bigrams: StartBigrams, short_rules: ShortRules,
+                      graph_size: tuple[int, ...]) -> str:
+    """
+    Short digest of what the rule graph serves, which changes when the
+    graph is reloaded with different rules (see get_dictionary_fingerprint).
+    """
+    digest = hashlib.blake2b(repr(graph_size).encode('utf-8'), digest_size=8)
+    for first in sorted(start_bigrams):
+        digest.update("\x1e".join([first, *sorted(start_bigrams[first])]).encode('utf-8'))
+        digest.update(b"\x1d")
+    for word in sorted(short_rules):
+        digest.update(f"{word}\x1e{short_rules[word]}\x1d".encode('utf-8'))
+    return digest.hexdigest()
+
+
+async def load_rule_tables(
+        driver: neo4j.AsyncDriver, cache_mode: str = "window"
+) -> tuple[StartBigrams, ShortRules, Optional[RuleDepths], str]:
+    """
+    Load the rule tables that DocuscopeTaggerNeo keeps in memory: the start
+    bigrams, the unigram rules and, for "best" mode, the rule depths.
+    They are returned along with a digest of the rule graph (see
+    rule_graph_digest) for namespacing the cached lookups.
+    """
+    async with driver.session() as session:
+        start_bigrams = await session.execute_read(get_start_bigrams)
+        short_rules = await session.execute_read(get_short_rule_table)
+        rule_depths = await session.execute_read(get_rule_depths) \
+            if cache_mode == "best" else None
+        graph_size = await session.execute_read(get_rule_graph_size)
+    logging.info("Loaded rule start bigrams for %d words and %d short rules.",
+                 len(start_bigrams), len(short_rules))
+    return start_bigrams, short_rules, rule_depths, \
+        rule_graph_digest(start_bigrams, short_rules, graph_size)
+
+
+async def get_all_lat_rules(trx: AsyncTransaction) -> list[LatRule]:
+    """ Retrieve every LAT rule in the rule graph (see LatRuleIndex). """
+    result = await trx.run(
+        "MATCH r = (s:Start)-[:NEXT*0..26]->()-[:LAT]->(l:Lat) "
+        "RETURN [s.word] + [p IN relationships(r) WHERE p.word IS NOT NULL | p.word] AS path, "
+        "l.lat AS lat")
+    return [{"lat": record["lat"],
+            "path": record["path"]}
+            async for record in result]
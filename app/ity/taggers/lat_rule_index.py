@@ -0,0 +1,169 @@
+""" A compact in-memory prefix index of the DocuScope LAT rules. """
+# coding=utf-8
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+import gzip
+from collections.abc import Iterable
+from itertools import islice
+from typing import Optional
+
+from .docuscope_tagger import DocuscopeDictionary
+from .docuscope_tagger_base import LatRule
+from .rule_starts import RuleStarts
+from .vocabulary import Vocabulary
+
+# The longest rule path that get_lat_rules can return:
+# four explicit NEXT steps plus NEXT*0..23.
+MAX_RULE_LENGTH = 27
+
+
+def best_short_rule(short_rules: dict[str, str],
+                    token_ds_words: list[str]) -> tuple[Optional[str], Optional[str]]:
+    """
+    Get the unigram (lat, word) for the given wordclasses from a word -> lat
+    table, choosing the way get_short_rules does: ORDER BY token DESC, lat DESC.
+    """
+    word = max((w for w in token_ds_words if w in short_rules), default=None)
+    if word is None:
+        return None, None
+    return short_rules[word], word
+
+
+class RuleNode:
+    """A node in the LAT rule prefix tree, with words and LATs by id."""
+    __slots__ = ('lats', 'next')
+
+    def __init__(self):
+        self.lats: list[int] = []  # LATs for rules ending at this node.
+        self.next: dict[int, RuleNode] = {}  # word -> continuation
+
+    def to_json(self, words: Vocabulary, lats: Vocabulary) -> list:
+        """Compact list form by name: [lats, {word: node}]."""
+        return [[lats.names[lat] for lat in self.lats],
+                {words.names[word]: node.to_json(words, lats)
+                 for word, node in self.next.items()}]
+
+    @classmethod
+    def from_json(cls, data: list, words: Vocabulary, lats: Vocabulary) -> 'RuleNode':
+        """Rebuild a node (and its subtree) from its compact list form."""
+        node = cls()
+        node.lats = [lats.add(lat) for lat in data[0]]
+        node.next = {words.add(word): cls.from_json(child, words, lats)
+                     for word, child in data[1].items()}
+        return node
+
+
+class LatRuleIndex:
+    """
+    Prefix tree of the rule graph stored in neo4j.
+
+    The root's children mirror the (:Start) nodes, edges mirror [:NEXT]
+    relationships, and a node's lats are the (:Lat) nodes reached through
+    [:LAT].  Walking the tree with the wordclasses of the upcoming tokens
+    gives the same longest match as get_lat_rules followed by
+    rule_applies_for_tokens, without any round trips to the database.
+
+    Wordclasses and LATs are stored by their id in word_ids and lat_ids,
+    so the tree is walked with the ids of the tokens' wordclasses (see
+    encode) and the names are only looked up for the rule found.
+    """
+
+    def __init__(self, root: Optional[RuleNode] = None,
+                 word_ids: Optional[Vocabulary] = None,
+                 lat_ids: Optional[Vocabulary] = None):
+        self.root = root or RuleNode()
+        self.word_ids = word_ids or Vocabulary()
+        self.lat_ids = lat_ids or Vocabulary()
+        # Unigram rules resolved the way get_short_rules orders them
+        # (ORDER BY lat DESC) so short lookups are a single dict access.
+        self.short_rules: dict[str, str] = {
+            self.word_ids.names[word]: self._max_lat(node)
+            for word, node in self.root.next.items() if node.lats}
+        self._rule_starts: Optional[RuleStarts] = None
+
+    def _max_lat(self, node: RuleNode) -> str:
+        return max(self.lat_ids.names[lat] for lat in node.lats)
+
+    def add_rule(self, path: list[str], lat: str) -> None:
+        """Add the rule path -> lat to the index."""
+        node = self.root
+        for word in path:
+            node = node.next.setdefault(self.word_ids.add(word), RuleNode())
+        node.lats.append(self.lat_ids.add(lat))
+        if len(path) == 1:
+            self.short_rules[path[0]] = self._max_lat(node)
+        self._rule_starts = None
+
+    def rule_starts(self) -> RuleStarts:
+        """The first steps of the long rules, for finding where they can start."""
+        if self._rule_starts is None:
+            self._rule_starts = RuleStarts(self.word_ids)
+            for first, first_node in self.root.next.items():
+                for second, node in first_node.next.items():
+                    self._rule_starts.add(first, second, bool(node.lats), node.next)
+        return self._rule_starts
+
+    def encode(self, ds_words: Iterable[str]) -> tuple[int, ...]:
+        """The ids of the wordclasses that appear in some rule."""
+        return self.word_ids.encode(ds_words)
+
+    def get_long_rule(self, ds_word_ids: Iterable[Iterable[int]]) -> Optional[LatRule]:
+        """
+        Find the longest rule of at least two words that matches.
+
+        :param ds_word_ids: the encoded wordclasses of the current token
+                            followed by those of the next included tokens.
+                            It is consumed lazily, only as far as there are
+                            rules to follow.
+        :return: the best LatRule or None if no long rule applies.
+        """
+        frontier: list[tuple[RuleNode, tuple[int, ...]]] = [(self.root, ())]
+        best: Optional[tuple[RuleNode, tuple[int, ...]]] = None
+        for depth, words in enumerate(islice(ds_word_ids, MAX_RULE_LENGTH)):
+            frontier = [(child, path + (word,))
+                        for node, path in frontier
+                        for word in words
+                        if (child := node.next.get(word)) is not None]
+            if not frontier:
+                break
+            if depth > 0:
+                best = next(((node, path) for node, path in frontier if node.lats), best)
+        if best is None:
+            return None
+        node, path = best
+        return {"lat": self.lat_ids.names[node.lats[0]],
+                "path": [self.word_ids.names[word] for word in path]}
+
+    def get_short_rule(self, token_ds_words: list[str]) -> tuple[Optional[str], Optional[str]]:
+        """Get the unigram (lat, word) for the given wordclasses."""
+        return best_short_rule(self.short_rules, token_ds_words)
+
+    @classmethod
+    def from_dictionary(cls, dictionary: DocuscopeDictionary) -> 'LatRuleIndex':
+        """Build an index from the rules of a JSON dictionary (see get_dictionary)."""
+        index = cls()
+        for first, seconds in dictionary['rules'].items():
+            for second, lats in seconds.items():
+                for lat, paths in lats.items():
+                    for path in paths:
+                        index.add_rule([first, second, *path], lat)
+        for word, lat in dictionary['shortRules'].items():
+            index.add_rule([word], lat)
+        return index
+
+    def dump(self, path: str) -> None:
+        """Write the index to a gzipped json file."""
+        with gzip.open(path, 'wt', encoding="UTF-8") as out:
+            out.write(json.dumps(self.root.to_json(self.word_ids, self.lat_ids)))
+
+    @classmethod
+    def load(cls, path: str) -> 'LatRuleIndex':
+        """Read an index written by dump()."""
+        word_ids = Vocabulary()
+        lat_ids = Vocabulary()
+        with gzip.open(path, 'rt', encoding="UTF-8") as jin:
+            root = RuleNode.from_json(json.loads(jin.read()), word_ids, lat_ids)
+        return cls(root, word_ids, lat_ids)
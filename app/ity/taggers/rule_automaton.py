@@ -0,0 +1,128 @@
+""" A matching automaton for the long rules of a JSON DocuScope dictionary. """
+# coding=utf-8
+from collections.abc import Iterable, Sequence
+from typing import Optional
+
+from .docuscope_tagger_base import LatRule
+from .rule_starts import RuleStarts
+from .vocabulary import Vocabulary
+
+# A partial match: (position of its first token, state, ranks of its first
+# two wordclasses among the tokens' wordclasses, wordclass ids so far).
+Thread = tuple[int, int, tuple[int, ...], tuple[int, ...]]
+
+
+class RuleAutomaton:
+    """
+    Prefix automaton of the long rules of a JSON dictionary
+    (first -> second -> lat -> [rest of the path]).
+
+    States are rule prefixes, numbered in order of creation, with their
+    transitions keyed by wordclass id.  A state that completes some rules
+    accepts the first of them in the dictionary's order.  Together with
+    where the first two wordclasses of a match come in the first two
+    tokens' wordclasses, that breaks ties between rules of the same length
+    the way DocuscopeTagger's greedy search did: by first wordclass,
+    second wordclass, then rule.
+
+    Matching follows every thread through the automaton at once on the
+    wordclass ids of each token, so the longest match at one token
+    (match) or at every token (scan) takes a single left-to-right pass.
+    """
+
+    def __init__(self, rules: dict[str, dict[str, dict[str, list[list[str]]]]]):
+        self.word_ids = Vocabulary()
+        self.lat_ids = Vocabulary()
+        self.transitions: list[dict[int, int]] = [{}]
+        # (order in the dictionary, lat id) of the rule each state accepts.
+        self.accepts: list[Optional[tuple[int, int]]] = [None]
+        for first, seconds in rules.items():
+            for second, lats in seconds.items():
+                order = 0
+                for lat, paths in lats.items():
+                    lat_id = self.lat_ids.add(lat)
+                    for path in paths:
+                        state = self._add_path([first, second, *path])
+                        if self.accepts[state] is None:
+                            self.accepts[state] = (order, lat_id)
+                        order += 1
+        self.rule_starts = RuleStarts(self.word_ids)
+        for first, first_state in self.transitions[0].items():
+            for second, state in self.transitions[first_state].items():
+                self.rule_starts.add(first, second, self.accepts[state] is not None,
+                                     self.transitions[state])
+
+    def _add_path(self, path: list[str]) -> int:
+        state = 0
+        for word in path:
+            word_id = self.word_ids.add(word)
+            child = self.transitions[state].get(word_id)
+            if child is None:
+                child = self.transitions[state][word_id] = len(self.transitions)
+                self.transitions.append({})
+                self.accepts.append(None)
+            state = child
+        return state
+
+    def encode(self, ds_words: Iterable[str]) -> tuple[int, ...]:
+        """The ids of the wordclasses that appear in some rule."""
+        return self.word_ids.encode(ds_words)
+
+    def _advance(self, threads: Iterable[Thread], word_ids: Sequence[int]) -> list[Thread]:
+        """Follow each thread on each of a token's wordclasses."""
+        transitions = self.transitions
+        return [(start, child, ranks + (rank,) if len(path) < 2 else ranks, path + (word_id,))
+                for start, state, ranks, path in threads
+                for rank, word_id in enumerate(word_ids)
+                if (child := transitions[state].get(word_id)) is not None]
+
+    def _rule(self, state: int, path: tuple[int, ...]) -> LatRule:
+        return {"lat": self.lat_ids.names[self.accepts[state][1]],
+                "path": [self.word_ids.names[word_id] for word_id in path]}
+
+    def match(self, ds_word_ids: Iterable[Sequence[int]]) -> Optional[LatRule]:
+        """
+        Find the longest rule that matches from the first token on.
+
+        :param ds_word_ids: the encoded wordclasses of the current token
+                            followed by those of the next included tokens,
+                            consumed only as far as there are rules to follow.
+        :return: the best LatRule or None if no long rule applies.
+        """
+        accepts = self.accepts
+        threads: list[Thread] = [(0, 0, (), ())]
+        best: Optional[Thread] = None
+        for word_ids in ds_word_ids:
+            threads = self._advance(threads, word_ids)
+            if not threads:
+                break
+            best = min((thread for thread in threads if accepts[thread[1]] is not None),
+                       key=lambda thread: (thread[2], accepts[thread[1]]), default=best)
+        return None if best is None else self._rule(best[1], best[3])
+
+    def scan(self, ds_word_ids: Iterable[Sequence[int]]) -> dict[int, LatRule]:
+        """
+        Find the longest rule that matches from each token on, in one pass.
+        Ties between rules of the same length are broken as in match, so
+        each rule is the one that match would find from that token.
+
+        :param ds_word_ids: the encoded wordclasses of the included tokens.
+        :return: the best LatRule by the position of the token it starts
+                 at, for the positions where some long rule applies.
+        """
+        accepts = self.accepts
+        threads: list[Thread] = []
+        best: dict[int, Thread] = {}
+        for position, word_ids in enumerate(ds_word_ids):
+            threads.append((position, 0, (), ()))
+            threads = self._advance(threads, word_ids)
+            for thread in threads:
+                start, state, ranks, path = thread
+                if accepts[state] is None:
+                    continue
+                found = best.get(start)
+                # A match one token longer than the best so far replaces it.
+                if (found is None or len(found[3]) < len(path) or
+                        (ranks, accepts[state]) < (found[2], accepts[found[1]])):
+                    best[start] = thread
+        return {start: self._rule(state, path) for start, state, _, path in best.values()}
@@ -0,0 +1,386 @@
+""" Caching support for rule lookups. """
+# coding=utf-8
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+import asyncio
+import hashlib
+import logging
+import zlib
+from collections import Counter, OrderedDict, defaultdict
+from collections.abc import Awaitable, Callable, Hashable, Iterable
+from time import monotonic, perf_counter
+from typing import Any, Optional
+
+import aiomcache
+
+from .docuscope_tagger_base import LatRule
+
+
+class LocalRuleCache:  # pylint: disable=too-many-instance-attributes
+    """
+    A bounded least-recently-used cache of decoded rule lookups that sits in
+    front of memcache.  It uses the same keys as the memcache entries but
+    keeps the decoded values so that hits need neither network I/O nor
+    json decoding.
+
+    The cache is bounded by number of entries and, optionally, by the total
+    size of the encoded values.  Entries older than ttl seconds are treated
+    as misses so that changes to the shared tier are eventually picked up.
+    """
+
+    def __init__(self, max_entries: int = 100000, max_bytes: int = 0,
+                 ttl: float = 3600):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes  # 0 for no size limit.
+        self.ttl = ttl  # 0 for no expiration.
+        # key -> (expiration time, size, value)
+        self._entries: OrderedDict[Hashable, tuple[float, int, Any]] = OrderedDict()
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Retrieve the value for key, None on a miss."""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires, _, value = entry
+        if self.ttl and expires < monotonic():
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, size: Optional[int] = None) -> None:
+        """Store value under key, size being the length of its encoded form."""
+        if size is None:
+            size = len(json.dumps(value)) if self.max_bytes else 0
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (monotonic() + self.ttl, size, value)
+        self.size_bytes += size
+        while self._entries and (
+                len(self._entries) > self.max_entries or
+                (self.max_bytes and self.size_bytes > self.max_bytes)):
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove(self, key: Hashable) -> None:
+        _, size, _ = self._entries.pop(key)
+        self.size_bytes -= size
+
+    def clear(self) -> None:
+        """Drop all entries, keeping the counters."""
+        self._entries.clear()
+        self.size_bytes = 0
+
+    def stats(self) -> dict[str, int]:
+        """Counters for monitoring the effectiveness of the cache."""
+        return {"entries": len(self._entries),
+                "bytes": self.size_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations}
+
+
+class LookupStats:
+    """
+    Cumulative cache effectiveness by kind of lookup (a cache mode or
+    "short"), shared by the taggers of a process so that the caching modes
+    can be compared on real traffic.
+    """
+
+    def __init__(self):
+        self.counts: defaultdict[str, Counter] = defaultdict(Counter)
+
+    # pylint: disable=too-many-arguments
+    def add(self, kind: str, *, lookups: int = 0, local_hits: int = 0,
+            memcache_hits: int = 0, stored: int = 0, queries: int = 0,
+            acquire_seconds: float = 0) -> None:
+        """
+        Count cache lookups, hits by tier, entries stored, and neo4j queries
+        with the time spent waiting to acquire their connections, for kind.
+        """
+        self.counts[kind].update(lookups=lookups, local_hits=local_hits,
+                                 memcache_hits=memcache_hits, stored=stored,
+                                 queries=queries, acquire_seconds=acquire_seconds)
+
+    def stats(self) -> dict[str, dict[str, float]]:
+        """Counters and hit rate for each kind of lookup."""
+        return {kind: {"lookups": counts["lookups"],
+                       "local_hits": counts["local_hits"],
+                       "memcache_hits": counts["memcache_hits"],
+                       "stored": counts["stored"],
+                       "queries": counts["queries"],
+                       "acquire_seconds": counts["acquire_seconds"],
+                       "hit_rate": (counts["local_hits"] + counts["memcache_hits"]) /
+                                   counts["lookups"] if counts["lookups"] else 0.0}
+                for kind, counts in self.counts.items()}
+
+
+class FetchCancelledError(Exception):
+    """Raised to the callers waiting on a shared fetch that was cancelled."""
+
+
+class SingleFlight:
+    """
+    Share in-flight rule queries among concurrent taggers so that lookups
+    that miss the caches at the same time, e.g. on a cold cache, are only
+    sent to neo4j once.
+
+    Fetches run in their own tasks: a cancelled caller stops waiting but
+    does not cancel a query that others are waiting on.  If a fetch is
+    cancelled anyway, the callers waiting on it did not cancel it, so they
+    fetch its lookups again themselves rather than being cancelled.
+    """
+
+    def __init__(self):
+        self._in_flight: dict[Hashable, asyncio.Future] = {}
+        self._tasks: set[asyncio.Task] = set()
+        self.fetched = 0
+        self.shared = 0
+
+    async def run(self, items: list[tuple[Hashable, Any]],
+                  fetch: Callable[[list[tuple[Hashable, Any]]], Awaitable[list]],
+                  retries: int = 1) -> list:
+        """
+        Resolve the (key, lookup) items to their values, in order.  fetch is
+        called with the items whose keys are not already in flight and
+        returns their values in order; the others wait on the fetch in flight.
+        Items whose fetch was cancelled are fetched again up to retries
+        times, after which FetchCancelledError is raised.
+        """
+        futures, owned = self._claim(items)
+        if owned:
+            task = asyncio.get_running_loop().create_task(self._fetch(fetch, owned))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        values = []
+        cancelled = []
+        for index, future in enumerate(futures):
+            try:
+                values.append(await asyncio.shield(future))
+            except FetchCancelledError:
+                if retries <= 0:
+                    raise
+                values.append(None)
+                cancelled.append(index)
+        if cancelled:
+            retried = await self.run([items[index] for index in cancelled], fetch, retries - 1)
+            for index, value in zip(cancelled, retried):
+                values[index] = value
+        return values
+
+    def _claim(self, items: list[tuple[Hashable, Any]]
+               ) -> tuple[list[asyncio.Future], list[tuple[Hashable, Any]]]:
+        """
+        The futures of the values of items, in order, and the items whose
+        keys were not in flight, which are now in flight for the caller.
+        """
+        loop = asyncio.get_running_loop()
+        futures = []
+        owned = []
+        for key, lookup in items:
+            future = self._in_flight.get(key)
+            if future is None:
+                future = self._in_flight[key] = loop.create_future()
+                owned.append((key, lookup))
+                self.fetched += 1
+            else:
+                self.shared += 1
+            futures.append(future)
+        return futures, owned
+
+    async def _fetch(self, fetch: Callable[[list[tuple[Hashable, Any]]], Awaitable[list]],
+                     items: list[tuple[Hashable, Any]]) -> None:
+        futures = [self._in_flight[key] for key, _ in items]
+        try:
+            for future, value in zip(futures, await fetch(items)):
+                future.set_result(value)
+        except asyncio.CancelledError:
+            # Not by the waiting callers (see run), which retry instead.
+            for future in futures:
+                if not future.done():
+                    future.set_exception(FetchCancelledError("shared rule fetch cancelled"))
+                    future.exception()  # retrieved by the waiters, if any
+            raise
+        except Exception as exc:  # pylint: disable=broad-except
+            # Passed on to the waiting callers.
+            for future in futures:
+                if not future.done():
+                    future.set_exception(exc)
+                    future.exception()  # retrieved by the waiters, if any
+        finally:
+            for (key, _), future in zip(items, futures):
+                if self._in_flight.get(key) is future:
+                    del self._in_flight[key]
+
+    def stats(self) -> dict[str, int]:
+        """Counters of the lookups fetched and of those that shared a fetch."""
+        return {"in_flight": len(self._in_flight),
+                "fetched": self.fetched,
+                "shared": self.shared}
+
+
+# Values larger than this many bytes are compressed.
+COMPRESS_THRESHOLD = 512
+_RAW = b'\x00'
+_ZLIB = b'\x01'
+_FIELD_SEP = '\x1f'
+_RECORD_SEP = '\x1e'
+
+
+def cache_key(namespace: str, kind: str, records: Iterable[Iterable[str]]) -> bytes:
+    """
+    Key for a rule lookup: the dictionary namespace, the kind of lookup,
+    and a digest of the lookup's wordclasses.
+    """
+    digest = hashlib.blake2b(
+        _RECORD_SEP.join(_FIELD_SEP.join(record) for record in records).encode('utf-8'),
+        digest_size=16).hexdigest()
+    return f"{namespace}:{kind}:{digest}".encode('utf-8')
+
+
+def _pack(records: list[list[str]], compress_threshold: int) -> bytes:
+    """Encode records of strings compactly, compressing long payloads."""
+    payload = _RECORD_SEP.join(_FIELD_SEP.join(record) for record in records).encode('utf-8')
+    if compress_threshold and len(payload) > compress_threshold:
+        return _ZLIB + zlib.compress(payload, 1)
+    return _RAW + payload
+
+
+def _unpack(payload: bytes) -> list[list[str]]:
+    """Decode records encoded by _pack."""
+    data = payload[1:]
+    if payload[:1] == _ZLIB:
+        data = zlib.decompress(data)
+    if not data:
+        return []
+    return [record.split(_FIELD_SEP) for record in data.decode('utf-8').split(_RECORD_SEP)]
+
+
+def encode_rules(rules: list[LatRule], compress_threshold: int = COMPRESS_THRESHOLD) -> bytes:
+    """Encode a long rule lookup result for memcache."""
+    return _pack([[rule['lat'], *rule['path']] for rule in rules], compress_threshold)
+
+
+def decode_rules(payload: bytes) -> list[LatRule]:
+    """Decode a long rule lookup result from memcache."""
+    if payload[:1] == b'[':  # json written by earlier versions
+        return json.loads(payload)
+    return [{"lat": record[0], "path": record[1:]} for record in _unpack(payload)]
+
+
+def encode_short_rule(rule: tuple[Optional[str], Optional[str]],
+                      compress_threshold: int = COMPRESS_THRESHOLD) -> bytes:
+    """Encode a short rule lookup result, (lat, token), for memcache."""
+    lat, token = rule
+    return _pack([[lat, token]] if lat is not None else [], compress_threshold)
+
+
+def decode_short_rule(payload: bytes) -> tuple[Optional[str], Optional[str]]:
+    """Decode a short rule lookup result from memcache."""
+    if payload[:1] == b'[':  # json written by earlier versions
+        lat, token = json.loads(payload)
+        return lat, token
+    records = _unpack(payload)
+    if not records:
+        return None, None
+    return records[0][0], records[0][1]
+
+
+class CacheWriter:  # pylint: disable=too-many-instance-attributes
+    """
+    Write-behind queue for memcache.  Values are queued by put() without
+    waiting and a background task writes them in batches of concurrent
+    sets.  When the queue is full new values are dropped: the cache is
+    only an optimization and tagging should never wait on it.
+    """
+
+    def __init__(self, cache: aiomcache.Client, max_queue: int = 10000,
+                 batch_size: int = 100):
+        self.cache = cache
+        self.batch_size = batch_size
+        self._queue: asyncio.Queue[tuple[bytes, bytes]] = asyncio.Queue(maxsize=max_queue)
+        self._task: Optional[asyncio.Task] = None
+        self.written = 0
+        self.dropped = 0
+        self.errors = 0
+        self.flushes = 0
+        self.last_flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+
+    def put(self, key: bytes, value: bytes) -> bool:
+        """Queue a memcache set, returns False if it was dropped."""
+        try:
+            self._queue.put_nowait((key, value))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return True
+
+    async def _run(self) -> None:
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            start_time = perf_counter()
+            results = await asyncio.gather(
+                *(self.cache.set(key, value) for key, value in batch),
+                return_exceptions=True)
+            self.last_flush_seconds = perf_counter() - start_time
+            self.max_flush_seconds = max(self.max_flush_seconds, self.last_flush_seconds)
+            self.flushes += 1
+            errors = [result for result in results if isinstance(result, Exception)]
+            if errors:
+                logging.warning("%d of %d cache writes failed: %s",
+                                len(errors), len(batch), errors[0])
+            self.errors += len(errors)
+            self.written += len(batch) - len(errors)
+            for _ in batch:
+                self._queue.task_done()
+
+    async def flush(self, timeout: Optional[float] = None) -> None:
+        """Wait for the queued writes to finish."""
+        if self._task is None or self._task.done():
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logging.warning("Timed out flushing %d cache writes.", self._queue.qsize())
+
+    async def close(self, timeout: Optional[float] = 5) -> None:
+        """Flush outstanding writes and stop the background task."""
+        await self.flush(timeout)
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict[str, float]:
+        """Counters for monitoring the write-behind queue."""
+        return {"queued": self._queue.qsize(),
+                "written": self.written,
+                "dropped": self.dropped,
+                "errors": self.errors,
+                "flushes": self.flushes,
+                "last_flush_seconds": self.last_flush_seconds,
+                "max_flush_seconds": self.max_flush_seconds}
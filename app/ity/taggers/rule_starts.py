@@ -0,0 +1,135 @@
+""" Which tokens of a document can start a long rule, found all at once. """
+# coding=utf-8
+from collections.abc import Iterable, Sequence
+from itertools import chain
+from typing import Optional
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .vocabulary import Vocabulary
+
+Relation = dict[int, set[int]]
+
+
+class RuleStarts:
+    """
+    The first three steps of a set of long rules, by wordclass id in
+    word_ids: the second wordclasses that follow each first one, the
+    third wordclasses that follow each second one and the second
+    wordclasses that end a two word rule.
+
+    A long rule can only start at a token if some first wordclass of it
+    is followed by a second one of the next token and that second one
+    either ends a rule or is followed by a third one of the token after.
+    candidates checks this for every token of a document at once, with
+    numpy if it is installed, so that the tagger only has to walk the
+    rules from the tokens that pass.  The check never rejects a token
+    that some rule matches from.
+    """
+
+    def __init__(self, word_ids: Vocabulary):
+        self.word_ids = word_ids
+        self.seconds: Relation = {}
+        self.thirds: Relation = {}
+        self.pair_ends: set[int] = set()
+        # Sorted first * len(word_ids) + second keys of seconds and thirds.
+        self._keys: Optional[tuple[int, 'np.ndarray', 'np.ndarray']] = None
+
+    def add(self, first: int, second: int, ends: bool, thirds: Iterable[int]) -> None:
+        """Add the rules that start with first, second."""
+        self.seconds.setdefault(first, set()).add(second)
+        if ends:
+            self.pair_ends.add(second)
+        thirds = set(thirds)
+        if thirds:
+            self.thirds.setdefault(second, set()).update(thirds)
+        self._keys = None
+
+    def candidates(self, surface_word_ids: Sequence[Sequence[int]],
+                   surfaces: Sequence[int]) -> list[int]:
+        """
+        The positions in surfaces from which a long rule may start.
+
+        :param surface_word_ids: the encoded wordclasses of each surface.
+        :param surfaces: the surface of each of a run of consecutive
+                         (included) tokens.
+        """
+        if len(surfaces) < 2:
+            return []
+        if np is None:
+            return self._candidates(surface_word_ids, surfaces)
+        return self._np_candidates(surface_word_ids, surfaces)
+
+    def _candidates(self, surface_word_ids: Sequence[Sequence[int]],
+                    surfaces: Sequence[int]) -> list[int]:
+        memos: tuple[dict, dict] = ({}, {})
+
+        def follows(relation: Relation, memo: dict, first: int, second: int) -> bool:
+            key = (first, second)
+            found = memo.get(key)
+            if found is None:
+                second_ids = surface_word_ids[second]
+                found = memo[key] = any(not relation[word_id].isdisjoint(second_ids)
+                                        for word_id in surface_word_ids[first]
+                                        if word_id in relation)
+            return found
+
+        ends = [not self.pair_ends.isdisjoint(word_ids) for word_ids in surface_word_ids]
+        return [position for position in range(len(surfaces) - 1)
+                if follows(self.seconds, memos[0], surfaces[position], surfaces[position + 1])
+                and (ends[surfaces[position + 1]] or
+                     (position + 2 < len(surfaces) and
+                      follows(self.thirds, memos[1],
+                              surfaces[position + 1], surfaces[position + 2])))]
+
+    def _relation_keys(self) -> tuple['np.ndarray', 'np.ndarray']:
+        size = len(self.word_ids)
+        if self._keys is None or self._keys[0] != size:
+            self._keys = (size, *(
+                np.unique(np.fromiter((first * size + second
+                                       for first, seconds in relation.items()
+                                       for second in seconds), dtype=np.int64))
+                for relation in (self.seconds, self.thirds)))
+        return self._keys[1], self._keys[2]
+
+    def _np_candidates(self, surface_word_ids: Sequence[Sequence[int]],
+                       surfaces: Sequence[int]) -> list[int]:
+        size = len(self.word_ids)
+        second_keys, third_keys = self._relation_keys()
+        lengths = np.fromiter(map(len, surface_word_ids), dtype=np.int64,
+                              count=len(surface_word_ids))
+        offsets = np.concatenate(([0], np.cumsum(lengths)))
+        flat = np.fromiter(chain.from_iterable(surface_word_ids), dtype=np.int64,
+                           count=offsets[-1])
+        owner = np.repeat(np.arange(len(surface_word_ids)), lengths)
+        ends = np.zeros(size, dtype=bool)
+        ends[list(self.pair_ends)] = True
+        surface_ends = np.bincount(owner[ends[flat]], minlength=len(surface_word_ids)) > 0
+
+        def follows(keys: 'np.ndarray', firsts: 'np.ndarray',
+                    seconds: 'np.ndarray') -> 'np.ndarray':
+            """Whether some pair of the surfaces' wordclasses is in keys, by pair."""
+            if len(keys) == 0 or len(firsts) == 0:
+                return np.zeros(len(firsts), dtype=bool)
+            pairs, inverse = np.unique(firsts * len(surface_word_ids) + seconds,
+                                       return_inverse=True)
+            first, second = np.divmod(pairs, len(surface_word_ids))
+            # Every combination of the two surfaces' wordclasses, pair by pair.
+            counts = lengths[first] * lengths[second]
+            pair = np.repeat(np.arange(len(pairs)), counts)
+            combination = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            width = lengths[second][pair]
+            words = (flat[offsets[first][pair] + combination // width] * size +
+                     flat[offsets[second][pair] + combination % width])
+            found = keys[np.minimum(np.searchsorted(keys, words), len(keys) - 1)] == words
+            return (np.bincount(pair[found], minlength=len(pairs)) > 0)[inverse.ravel()]
+
+        surfaces = np.asarray(surfaces, dtype=np.int64)
+        thirds = np.zeros(len(surfaces) - 1, dtype=bool)
+        thirds[:-1] = follows(third_keys, surfaces[1:-1], surfaces[2:])
+        viable = follows(second_keys, surfaces[:-1], surfaces[1:]) & (
+            surface_ends[surfaces[1:]] | thirds)
+        return np.flatnonzero(viable).tolist()
@@ -3,13 +3,13 @@
 __author__ = 'kohlmannj'
 
 import abc
-from dataclasses import dataclass
-from typing import List, Optional, Tuple
-
-from pydantic.main import BaseModel
+from array import array
+from collections.abc import Iterator, Sequence
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple, overload
 
 from ..base import BaseClass
-from ..tokenizers.tokenizer import Token, Tokenizer, TokenType
+from ..tokenizers.tokenizer import Token, TokenTable, Tokenizer, TokenType
 
 
 @dataclass
@@ -22,11 +22,12 @@ class TaggerRule():
     num_tags: int = 0
     num_included_tokens: int = 0
 
-class TaggerTag(BaseModel): # pylint: disable=too-many-instance-attributes
+@dataclass(slots=True)
+class TaggerTag(): # pylint: disable=too-many-instance-attributes
     """Model for Tagger tags."""
     # Note that the index and pos values in this empty tag are intentionally
     # invalid according to Tagger._is_valid_tag().
-    rules: List[Tuple[str, List[str]]] = []
+    rules: List[Tuple[str, List[str]]] = field(default_factory=list)
     index_start: int = -1
     index_end: int = -1
     len: int = 0
@@ -35,6 +36,84 @@ class TaggerTag(BaseModel): # pylint: disable=too-many-instance-attributes
     token_end_len: int = 0
     num_included_tokens: int = 0
 
+    def __contains__(self, name: str) -> bool:
+        # Templates test for optional fields, eg. {% if "classes" in tag %}
+        return hasattr(self, name)
+
+
+class TagStore(Sequence[TaggerTag]):  # pylint: disable=too-many-instance-attributes
+    """
+    The tags of a document, stored field by field in typed arrays rather
+    than as one object per tag.  Tags are added with append() and read back
+    as TaggerTag instances made on access, so a TagStore can be used where
+    a list of TaggerTags was.  Tags with the same rules share one entry in
+    the table of rules.
+    """
+
+    def __init__(self, tags: Sequence[TaggerTag] = ()):
+        self.index_start = array('i')
+        self.index_end = array('i')
+        self.len = array('i')
+        self.pos_start = array('q')
+        self.pos_end = array('q')
+        self.token_end_len = array('i')
+        self.num_included_tokens = array('i')
+        self.rule_id = array('i')  # index into self.rules
+        self.rules: list[List[Tuple[str, List[str]]]] = []
+        self._rule_ids: dict[tuple, int] = {}
+        for tag in tags:
+            self.append(tag)
+
+    def append(self, tag: TaggerTag) -> None:
+        """Add a tag at the end."""
+        key = tuple((name, tuple(path) if isinstance(path, list) else path)
+                    for name, path in tag.rules)
+        rule_id = self._rule_ids.get(key)
+        if rule_id is None:
+            rule_id = self._rule_ids[key] = len(self.rules)
+            self.rules.append(tag.rules)
+        self.index_start.append(tag.index_start)
+        self.index_end.append(tag.index_end)
+        self.len.append(tag.len)
+        self.pos_start.append(tag.pos_start)
+        self.pos_end.append(tag.pos_end)
+        self.token_end_len.append(tag.token_end_len)
+        self.num_included_tokens.append(tag.num_included_tokens)
+        self.rule_id.append(rule_id)
+
+    def rule_names(self, short: bool = False) -> list[str]:
+        """
+        The full name of the first rule of each tag, or if short, its last
+        part (the LAT).  Each distinct name is only made once.
+        """
+        names = [rules[0][0].split('.')[-1] if short else rules[0][0] for rules in self.rules]
+        return [names[rule_id] for rule_id in self.rule_id]
+
+    def __len__(self) -> int:
+        return len(self.rule_id)
+
+    @overload
+    def __getitem__(self, index: int) -> TaggerTag: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> list[TaggerTag]: ...
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        return TaggerTag(rules=list(self.rules[self.rule_id[index]]),
+                         index_start=self.index_start[index],
+                         index_end=self.index_end[index],
+                         len=self.len[index],
+                         pos_start=self.pos_start[index],
+                         pos_end=self.pos_end[index],
+                         token_end_len=self.token_end_len[index],
+                         num_included_tokens=self.num_included_tokens[index])
+
+    def __iter__(self) -> Iterator[TaggerTag]:
+        for index in range(len(self)):
+            yield self[index]
+
 class Tagger(BaseClass): # pylint: disable=too-many-instance-attributes
     """
     This is the Ity Tagger base class. It contains an abstract method, tag(),
@@ -240,7 +319,7 @@ class Tagger(BaseClass): # pylint: disable=too-many-instance-attributes
         self.tokens = []
         self.token_index = 0
         self.rules = {}
-        self.tags = []
+        self.tags = TagStore()
         # Should we return tags for which only a particular "meta" rule applies?
         self.return_untagged_tags = return_untagged_tags
         self.return_no_rules_tags = return_no_rules_tags
@@ -411,19 +490,17 @@ class Tagger(BaseClass): # pylint: disable=too-many-instance-attributes
         """
         if starting_token_index is None:
             starting_token_index = self.token_index
-        next_token_index = starting_token_index
-        while offset > 0:
-            next_token_index += 1
-            # Don't go beyond the bounds of the tokens list!
-            if next_token_index >= len(self.tokens):
-                break
-            next_token = self.tokens[next_token_index]
-            if next_token.type not in self.excluded_token_types:
-                offset -= 1
+        if offset <= 0:
+            return starting_token_index
+        # Don't go beyond the bounds of the tokens list!
+        if starting_token_index >= len(self._tokens):
+            return None
+        included, following = self._included_token_indexes or self._index_included_tokens()
+        rank = (following[starting_token_index] if starting_token_index >= 0 else 0) + offset - 1
         # Did we actually get the nth next token index?
-        if offset > 0:
+        if rank >= len(included):
             return None
-        return next_token_index
+        return included[rank]
 
     def get_next_tokens_in_range(self, start: int, end: int) -> list[Token]:
         """Get the list of tokens from the current index plus m to n.
@@ -431,16 +508,45 @@ class Tagger(BaseClass): # pylint: disable=too-many-instance-attributes
         Note: the number of tokens returned will only be as long as
         the available tokens and thus the length of the resulting list
         might be less than n-m."""
-        tokens = []
+        return [self._tokens[index] for index in self._get_next_token_indexes_in_range(start, end)]
+
+    def _get_next_token_indexes_in_range(self, start: int, end: int) -> list[int]:
+        """The indexes of the tokens returned by get_next_tokens_in_range."""
         token_index = self._get_nth_next_included_token_index(offset=start)
-        while (token_index is not None) and (start < end):
-            tokens.append(self.tokens[token_index])
-            token_index = self._get_nth_next_included_token_index(starting_token_index=token_index)
-            start += 1
-        return tokens
+        if token_index is None or start >= end:
+            return []
+        included, following = self._included_token_indexes or self._index_included_tokens()
+        rank = following[token_index] if token_index < len(following) else len(included)
+        return [token_index] + included[rank:rank + end - start - 1]
+
+    @property
+    def tokens(self) -> TokenTable:
+        """The tokens being tagged."""
+        return self._tokens
+
+    @tokens.setter
+    def tokens(self, tokens: Sequence[Token]) -> None:
+        self._tokens = tokens if isinstance(tokens, TokenTable) else TokenTable(tokens)
+        self._included_token_indexes: Optional[tuple[list[int], list[int]]] = None
+
+    def _index_included_tokens(self) -> tuple[list[int], list[int]]:
+        """
+        Index self.tokens once so that finding the nth next included token is
+        a lookup: the indexes of the included tokens and, for each token
+        index, the position in that list of the first included token after it.
+        """
+        excluded = {token_type.value for token_type in self.excluded_token_types}
+        included = []
+        following = []
+        for index, value in enumerate(self._tokens.type):
+            if value not in excluded:
+                included.append(index)
+            following.append(len(included))
+        self._included_token_indexes = (included, following)
+        return self._included_token_indexes
 
     @abc.abstractmethod
-    async def tag(self, tokens: list[Token]) -> tuple[dict[str,TaggerRule], list[TaggerTag]]:
+    async def tag(self, tokens: Sequence[Token]) -> tuple[dict[str,TaggerRule], TagStore]:
         """
         An abstract method where all the tagging of the tokens list happens.
         It's recommended to assign the tokens argument to self.tokens
@@ -448,17 +554,17 @@ class Tagger(BaseClass): # pylint: disable=too-many-instance-attributes
         easily access these values (and avoid a huge, gross method body here).
 
         :param tokens: A list of tokens returned by an Ity Tokenizer's
-                       tokenize() method.
-        :type tokens: list of Tokens.
+                       tokenize() method, or a TokenTable.
+        :type tokens: Sequence of Tokens.
         :return: In order: rule, a dict of Tagger Rules,
-                 and tags, a list of Tagger Tags.
-        :rtype: dict of TaggerRules and list of TaggerTags
+                 and tags, a TagStore of Tagger Tags.
+        :rtype: dict of TaggerRules and TagStore
         """
-        return {}, []
+        return {}, TagStore()
 
     def reset(self):
         """Reset the tagging state."""
         self.tokens = []
         self.token_index = 0
         self.rules = {}
-        self.tags = []
+        self.tags = TagStore()
@@ -0,0 +1,42 @@
+""" Dense integer ids for the names of wordclasses and LATs. """
+# coding=utf-8
+from collections.abc import Iterable
+from typing import Optional
+
+
+class Vocabulary:
+    """
+    Maps names to dense integer ids, given in order of first use, and ids
+    back to names.  Matching on ids keeps names out of the hot loops; the
+    names are only needed again for output.
+    """
+    __slots__ = ('ids', 'names')
+
+    def __init__(self, names: Iterable[str] = ()):
+        self.ids: dict[str, int] = {}
+        self.names: list[str] = []
+        for name in names:
+            self.add(name)
+
+    def add(self, name: str) -> int:
+        """The id of name, giving it the next id if it is new."""
+        name_id = self.ids.get(name)
+        if name_id is None:
+            name_id = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return name_id
+
+    def get(self, name: str) -> Optional[int]:
+        """The id of name, None if it has none."""
+        return self.ids.get(name)
+
+    def encode(self, names: Iterable[str]) -> tuple[int, ...]:
+        """The ids of those of names that have one, in order."""
+        ids = self.ids
+        return tuple(ids[name] for name in names if name in ids)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.ids
@@ -3,10 +3,11 @@
 __author__ = 'kohlmannj'
 
 import re
+from collections.abc import Iterator
 from html import unescape
 from typing import Optional
 
-from .tokenizer import Token, Tokenizer, TokenType
+from .tokenizer import Token, TokenTable, Tokenizer, TokenType
 
 
 class RegexTokenizer(Tokenizer):
@@ -501,7 +502,13 @@ class RegexTokenizer(Tokenizer):
         text -- str to tokenize
 
         """
-        tokens = []
+        return list(self._captures(text))
+
+    def tokenize_table(self, text: str) -> TokenTable:
+        return TokenTable(self._captures(text))
+
+    def _captures(self, text: str) -> Iterator[Token]:
+        """Generate a Token for each token captured from text."""
         for match in self.tokenize_pattern.finditer(text):
             # The starting byte position of this capture in the original plain
             # text string.
@@ -566,7 +573,5 @@ class RegexTokenizer(Tokenizer):
             # token to the tokens list. Therefore, `continue`.
             else:
                 continue
-            # All done, so add the final single_token_list list to the list of tokens.
-            tokens.append(single_token_list)
-        # Return the goods!
-        return tokens
+            # All done, so output the final single_token_list.
+            yield single_token_list
@@ -3,10 +3,12 @@
 __author__ = 'kohlmannj'
 
 import abc
+from array import array
+from collections import Counter
+from collections.abc import Iterable, Iterator, Sequence
+from dataclasses import dataclass
 from enum import Enum, unique
-from typing import Optional
-
-from pydantic.main import BaseModel
+from typing import Optional, overload
 
 from ..base import BaseClass
 
@@ -20,7 +22,8 @@ class TokenType(Enum):
     WHITESPACE = 2  # A whitespace token, i.e. a tab or space.
     NEWLINE = 3     # A newline token, i.e. "\n".
 
-class Token(BaseModel):
+@dataclass(slots=True)
+class Token():
     """Model of a Tokens."""
     # List of token strings, with the preferred string always at
     # index 0 and the original string always at index -1.
@@ -29,6 +32,92 @@ class Token(BaseModel):
     length: int # byte length of this token in original string.
     type: Optional[TokenType] = None # the Token type of this token.
 
+# TokenTypes by value, for decoding TokenTable.type.
+TOKEN_TYPES = tuple(sorted(TokenType, key=lambda token_type: token_type.value))
+
+
+class TokenTable(Sequence[Token]):
+    """
+    The tokens of a document, stored field by field in typed arrays rather
+    than as one Token per token.  Tokens with the same strings share one
+    entry in the table of strings.  Reading a token makes a Token, so a
+    TokenTable can be used where a list of Tokens was; the type_of(),
+    strings_of(), position and length accessors avoid making one.
+    """
+
+    def __init__(self, tokens: Iterable[Token] = ()):
+        self.position = array('q')
+        self.length = array('i')
+        self.type = array('b')  # TokenType value, -1 for None
+        self.string_id = array('i')  # index into self.strings
+        self.strings: list[list[str]] = []
+        self._string_ids: dict[tuple[str, ...], int] = {}
+        for token in tokens:
+            self.append(token)
+
+    def append(self, token: Token) -> None:
+        """Add a token at the end."""
+        self.add(token.strings, token.position, token.length, token.type)
+
+    def add(self, strings: list[str], position: int, length: int,
+            token_type: Optional[TokenType]) -> None:
+        """Add a token at the end from its fields."""
+        key = tuple(strings)
+        string_id = self._string_ids.get(key)
+        if string_id is None:
+            string_id = self._string_ids[key] = len(self.strings)
+            self.strings.append(list(strings))
+        self.position.append(position)
+        self.length.append(length)
+        self.type.append(-1 if token_type is None else token_type.value)
+        self.string_id.append(string_id)
+
+    def type_of(self, index: int) -> Optional[TokenType]:
+        """The type of the token at index."""
+        value = self.type[index]
+        return None if value < 0 else TOKEN_TYPES[value]
+
+    def strings_of(self, index: int) -> list[str]:
+        """The strings of the token at index, shared with tokens like it: do not modify."""
+        return self.strings[self.string_id[index]]
+
+    def type_counts(self) -> Counter:
+        """The number of tokens of each TokenType."""
+        return Counter({None if value < 0 else TOKEN_TYPES[value]: count
+                        for value, count in Counter(self.type).items()})
+
+    def __len__(self) -> int:
+        return len(self.string_id)
+
+    @overload
+    def __getitem__(self, index: int) -> Token: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> list[Token]: ...
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._token(i) for i in range(*index.indices(len(self)))]
+        return self._token(index)
+
+    def _token(self, index: int) -> Token:
+        value = self.type[index]
+        return Token(strings=list(self.strings[self.string_id[index]]),
+                     position=self.position[index],
+                     length=self.length[index],
+                     type=None if value < 0 else TOKEN_TYPES[value])
+
+    def __iter__(self) -> Iterator[Token]:
+        for index in range(len(self)):
+            yield self._token(index)
+
+
+def count_token_types(tokens: Sequence[Token]) -> Counter:
+    """The number of tokens of each TokenType."""
+    if isinstance(tokens, TokenTable):
+        return tokens.type_counts()
+    return Counter(token.type for token in tokens)
+
 class Tokenizer(BaseClass):
     """
     This is the Ity Tokenizer base class. It contains an abstract method,
@@ -199,3 +288,11 @@ class Tokenizer(BaseClass):
         :rtype list
         """
         return []
+
+    def tokenize_table(self, text: str) -> TokenTable:
+        """
+        Tokenize text like tokenize() into a TokenTable, which takes much
+        less memory than a list of Tokens.  Subclasses may build the table
+        without making the Tokens.
+        """
+        return TokenTable(self.tokenize(text))
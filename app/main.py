@@ -6,7 +6,7 @@ import re
 import traceback
 from collections import Counter, defaultdict
 from collections.abc import AsyncIterator
-from contextlib import asynccontextmanager
+from contextlib import aclosing, asynccontextmanager
 from datetime import datetime, timedelta, timezone
 from time import perf_counter
 from typing import List, Literal, Optional, Union
@@ -29,16 +29,25 @@ from sse_starlette.sse import EventSourceResponse
 from starlette.middleware.cors import CORSMiddleware
 from typing_extensions import Annotated
 
+from .cache_warmup import WarmupReport, warm_rule_cache
 from .count_patterns import CategoryPatternData, count_patterns, sort_patterns
 from .database import Submission, Tagging
 from .default_settings import SETTINGS, SQLALCHEMY_DATABASE_URI
 from .docx_to_text import docx_to_text
-from .ds_tagger import get_wordclasses
+from .ds_tagger import (create_circuit_breaker, get_dictionary_fingerprint,
+                        get_fallback_rule_index, get_rule_index, get_wordclasses)
 from .ity.formatters.simple_html_formatter import SimpleHTMLFormatter
 from .ity.tagger import ItyTaggerResult, tag_json
-from .ity.taggers.docuscope_tagger_neo import DocuscopeTaggerNeo
+from .ity.taggers.circuit_breaker import CircuitBreaker
+from .ity.taggers.docuscope_tagger_base import DocuscopeTaggerBase
+from .ity.taggers.docuscope_tagger_index import DocuscopeTaggerIndex
+from .ity.taggers.docuscope_tagger_neo import (DocuscopeTaggerNeo, RuleDepths, ShortRules,
+                                               StartBigrams, load_rule_tables)
+from .ity.taggers.lat_rule_index import LatRuleIndex
+from .ity.taggers.rule_cache import (CacheWriter, LocalRuleCache, LookupStats,
+                                     SingleFlight)
 from .ity.tokenizers.regex_tokenizer import RegexTokenizer
-from .ity.tokenizers.tokenizer import TokenType
+from .ity.tokenizers.tokenizer import TokenType, count_token_types
 from .lat_frame import generate_tagged_html
 
 # pylint: disable=not-callable
@@ -49,6 +58,66 @@ SESSION = sessionmaker(bind=ENGINE, expire_on_commit=False,
                        class_=AsyncSession, future=True)
 DRIVER: AsyncDriver = None
 WORDCLASSES: dict[str, list[str]] = None
+RULE_INDEX: Optional[LatRuleIndex] = None
+LOCAL_CACHE: Optional[LocalRuleCache] = None
+CACHE_WRITER: Optional[CacheWriter] = None
+CACHE_NAMESPACE: str = ""
+START_BIGRAMS: Optional[StartBigrams] = None
+SHORT_RULES: Optional[ShortRules] = None
+RULE_DEPTHS: Optional[RuleDepths] = None
+LOOKUP_STATS = LookupStats()
+SINGLE_FLIGHT = SingleFlight()
+SURFACE_CACHE: Optional[LocalRuleCache] = None
+CIRCUIT_BREAKER = create_circuit_breaker()
+FALLBACK_RULES: Optional[LatRuleIndex] = None
+WARMUP: Optional[WarmupReport] = None
+# Long lived taggers shared by all requests, each call tags in a context of its own.
+TAGGER: Optional[DocuscopeTaggerBase] = None  # for documents
+TEXT_TAGGER: Optional[DocuscopeTaggerBase] = None  # for posted text, with untagged tags
+
+
+def create_tagger(  # pylint: disable=too-many-arguments,too-many-locals
+        wordclasses: dict[str, list[str]],
+        driver: AsyncDriver,
+        cache: Optional[aiomcache.Client],
+        rule_index: Optional[LatRuleIndex],
+        *,
+        local_cache: Optional[LocalRuleCache] = None,
+        cache_writer: Optional[CacheWriter] = None,
+        cache_namespace: str = "",
+        start_bigrams: Optional[StartBigrams] = None,
+        short_rules: Optional[ShortRules] = None,
+        rule_depths: Optional[RuleDepths] = None,
+        lookup_stats: Optional[LookupStats] = None,
+        surface_cache: Optional[LocalRuleCache] = None,
+        single_flight: Optional[SingleFlight] = None,
+        circuit_breaker: Optional[CircuitBreaker] = None,
+        fallback: Optional[LatRuleIndex] = None,
+        plan_lookups: bool = True,
+        **kwargs) -> DocuscopeTaggerBase:
+    """Create a DocuScope tagger, using the local rule index when it is available."""
+    if rule_index is not None:
+        return DocuscopeTaggerIndex(wordclasses=wordclasses, rule_index=rule_index, **kwargs)
+    return DocuscopeTaggerNeo(wordclasses=wordclasses, driver=driver, cache=cache,
+                              local_cache=local_cache, cache_writer=cache_writer,
+                              cache_namespace=cache_namespace, start_bigrams=start_bigrams,
+                              short_rules=short_rules, rule_depths=rule_depths,
+                              cache_mode=SETTINGS.rule_cache_mode,
+                              lookup_stats=lookup_stats, surface_cache=surface_cache,
+                              single_flight=single_flight, circuit_breaker=circuit_breaker,
+                              fallback=fallback, plan_lookups=plan_lookups, **kwargs)
+
+
+def tagger_options() -> dict:
+    """The resident rule tables and caches shared by all of the taggers."""
+    return {"local_cache": LOCAL_CACHE, "cache_namespace": CACHE_NAMESPACE,
+            "start_bigrams": START_BIGRAMS, "short_rules": SHORT_RULES,
+            "rule_depths": RULE_DEPTHS,
+            "lookup_stats": LOOKUP_STATS, "surface_cache": SURFACE_CACHE,
+            "single_flight": SINGLE_FLIGHT, "batch_size": SETTINGS.neo4j_batch_size,
+            "circuit_breaker": CIRCUIT_BREAKER, "fallback": FALLBACK_RULES,
+            "plan_lookups": SETTINGS.plan_lookups,
+            "paragraph_concurrency": SETTINGS.paragraph_concurrency}
 
 
 async def reset_submitted(sessions: sessionmaker):
@@ -72,8 +141,12 @@ async def count_submitted(sql: AsyncSession):
 async def tag_documents_task(  # pylint: disable=too-many-locals
         sessions: sessionmaker,
         driver: AsyncDriver,
-        wordclasses: dict[str, list[str]]):
-    """Task for tagging documents using internal scheduler."""
+        wordclasses: dict[str, list[str]],
+        rule_index: Optional[LatRuleIndex] = None,
+        **options):
+    """Task for tagging documents using internal scheduler.
+
+    options are passed on to create_tagger (see tagger_options)."""
     sql: AsyncSession
     async with sessions.begin() as sql:
         submitted = await count_submitted(sql)
@@ -84,6 +157,13 @@ async def tag_documents_task(  # pylint: disable=too-many-locals
         pending = await sql.execute(select(Submission.id, Submission.content, Submission.name)
                                     .where(Submission.state == 'pending'))
         cache = aiomcache.Client(SETTINGS.memcache_url, SETTINGS.memcache_port)
+        cache_writer = CacheWriter(cache, max_queue=SETTINGS.rule_cache_write_queue)
+        tagger = create_tagger(
+            wordclasses, driver, cache, rule_index,
+            cache_writer=cache_writer, **options,
+            return_untagged_tags=False,
+            return_no_rules_tags=True,
+            return_included_tags=True)
         for (doc_id, doc_content, name) in pending:
             start_time = perf_counter()
             async with sessions.begin() as sub:
@@ -120,17 +200,13 @@ async def tag_documents_task(  # pylint: disable=too-many-locals
                 continue
             try:
                 tokenizer = RegexTokenizer()
-                tokens = tokenizer.tokenize(doc_content)
-                tagger = DocuscopeTaggerNeo(
-                    return_untagged_tags=False,
-                    return_no_rules_tags=True,
-                    return_included_tags=True,
-                    wordclasses=wordclasses,
-                    driver=driver,
-                    cache=cache)
-                rules, tags = await tagger.tag(tokens)
+                tokens = tokenizer.tokenize_table(doc_content)
+                if tagger.resolves_synchronously:  # keep the event loop free
+                    context = await asyncio.to_thread(tagger.tag_context_sync, tokens)
+                else:
+                    context = await tagger.tag_context(tokens)
                 output = SimpleHTMLFormatter().format(
-                    tags=(rules, tags), tokens=tokens, text_str=doc_content)
+                    tags=(context.rules, context.tags), tokens=tokens, text_str=doc_content)
                 if len(tokens) == 0:
                     logging.error("No tokens after tagging %s", doc_id)
                     await sql.execute(update(Submission).where(Submission.id == doc_id).values(
@@ -141,7 +217,7 @@ async def tag_documents_task(  # pylint: disable=too-many-locals
                         }
                     ))
                     continue
-                type_count = Counter([token.type for token in tokens])
+                type_count = count_token_types(tokens)
                 not_excluded = set(TokenType) - \
                     set(tokenizer.excluded_token_types)
                 await sql.execute(update(Submission).where(Submission.id == doc_id).values(
@@ -149,7 +225,7 @@ async def tag_documents_task(  # pylint: disable=too-many-locals
                     processed=tag_json(ItyTaggerResult(
                         text_contents=doc_content,
                         format_output=output,
-                        tag_dict=tagger.rules,
+                        tag_dict=context.rules,
                         num_tokens=len(tokens),
                         num_word_tokens=type_count[TokenType.WORD],
                         num_punctuation_tokens=type_count[TokenType.PUNCTUATION],
@@ -157,10 +233,10 @@ async def tag_documents_task(  # pylint: disable=too-many-locals
                                                 for itype in not_excluded),
                         num_excluded_tokens=sum(
                             type_count[etype] for etype in tokenizer.excluded_token_types),
-                        tag_chain=[tag.rules[0][0].split(
-                            '.')[-1] for tag in tagger.tags],
+                        tag_chain=context.tags.rule_names(short=True),
                         tagging_time=timedelta(
-                            seconds=perf_counter() - start_time)
+                            seconds=perf_counter() - start_time),
+                        backend=context.backend
                     )).model_dump()
                 ))
             except Exception as exc:
@@ -175,6 +251,7 @@ async def tag_documents_task(  # pylint: disable=too-many-locals
                         'tagging_time': str(timedelta(seconds=perf_counter() - start_time))
                     }
                 ))
+        await cache_writer.close()
         await cache.close()
 
 
@@ -183,27 +260,68 @@ async def lifespan(_app: FastAPI):
     """Setup and teardown of required resources.
 
     Load the wordclasses file which is required as part of ananlysis.
-    Setup caching.
+    Load the exported rule index, if there is one, otherwise the fallback
+    rules for when neo4j is unavailable.
+    Setup caching, both memcache and the in-process rule cache, and warm
+    it with the lookups of recent submissions if so configured.
     Reset any "submitted" documents, assuming that they are remnants of
     a crashed tagging process."""
     # Startup
-    global WORDCLASSES, CACHE, DRIVER  # pylint: disable=global-statement
+    # pylint: disable=global-statement
+    global WORDCLASSES, CACHE, DRIVER, CACHE_NAMESPACE
+    global RULE_INDEX, FALLBACK_RULES, START_BIGRAMS, SHORT_RULES, RULE_DEPTHS
+    global LOCAL_CACHE, SURFACE_CACHE, CACHE_WRITER, WARMUP
+    global TAGGER, TEXT_TAGGER
+    # pylint: enable=global-statement
     WORDCLASSES = get_wordclasses()  # load word classes file.
+    RULE_INDEX = get_rule_index()  # load local rules, None if not exported.
     DRIVER = AsyncGraphDatabase.driver(
         str(SETTINGS.neo4j_uri),
         auth=(SETTINGS.neo4j_user,
-              SETTINGS.neo4j_password.get_secret_value()))  # pylint: disable=no-member
+              SETTINGS.neo4j_password.get_secret_value()),  # pylint: disable=no-member
+        max_connection_pool_size=SETTINGS.neo4j_max_connection_pool_size,
+        connection_acquisition_timeout=SETTINGS.neo4j_connection_acquisition_timeout)
     logging.debug(SETTINGS.model_dump())
     await DRIVER.verify_authentication()
     await DRIVER.verify_connectivity()
+    rule_graph = ""
+    if RULE_INDEX is None:  # load the resident rule tables for neo4j lookups.
+        START_BIGRAMS, SHORT_RULES, RULE_DEPTHS, rule_graph = await load_rule_tables(
+            DRIVER, SETTINGS.rule_cache_mode)
+        if SETTINGS.rule_fallback:
+            FALLBACK_RULES = get_fallback_rule_index()
+    # cache keyspace of this version of the dictionary and rule graph.
+    CACHE_NAMESPACE = get_dictionary_fingerprint(rule_graph=rule_graph)
+    logging.info("Rule cache namespace for %s: %s", SETTINGS.dictionary, CACHE_NAMESPACE)
 
     try:
         CACHE = aiomcache.Client(SETTINGS.memcache_url, SETTINGS.memcache_port)
+        CACHE_WRITER = CacheWriter(CACHE, max_queue=SETTINGS.rule_cache_write_queue)
         # [emcache.MemcachedHostAddress(
         # SETTINGS.memcache_url, SETTINGS.memcache_port)])
     except asyncio.TimeoutError as exc:
         logging.warning(exc)
         CACHE = None
+    LOCAL_CACHE = LocalRuleCache(max_entries=SETTINGS.rule_cache_entries,
+                                 max_bytes=SETTINGS.rule_cache_bytes,
+                                 ttl=SETTINGS.rule_cache_ttl_seconds)
+    if SETTINGS.surface_cache_entries > 0:
+        SURFACE_CACHE = LocalRuleCache(max_entries=SETTINGS.surface_cache_entries,
+                                       ttl=SETTINGS.rule_cache_ttl_seconds)
+    TAGGER = create_tagger(WORDCLASSES, DRIVER, CACHE, RULE_INDEX,
+                           cache_writer=CACHE_WRITER, **tagger_options(),
+                           return_untagged_tags=False, return_no_rules_tags=True,
+                           return_included_tags=True)
+    TEXT_TAGGER = create_tagger(WORDCLASSES, DRIVER, CACHE, RULE_INDEX,
+                                cache_writer=CACHE_WRITER, **tagger_options(),
+                                return_untagged_tags=True, return_no_rules_tags=True,
+                                return_included_tags=True)
+    if RULE_INDEX is None and SETTINGS.rule_cache_warmup_documents > 0:
+        WARMUP = await warm_rule_cache(
+            ENGINE, TAGGER,
+            max_documents=SETTINGS.rule_cache_warmup_documents,
+            max_lookups=SETTINGS.rule_cache_warmup_lookups,
+            max_seconds=SETTINGS.rule_cache_warmup_seconds)
     # Reset any submitted database entries on the assumption
     # that only a single tagger exists and any pending documents
     # are from the tagger getting killed in the middle of processing.
@@ -216,7 +334,7 @@ async def lifespan(_app: FastAPI):
         # Context likely on another thread so no global variables
         scheduler.add_job(tag_documents_task, IntervalTrigger(
             seconds=SETTINGS.scheduler_interval_seconds),
-            [SESSION, DRIVER, WORDCLASSES])
+            [SESSION, DRIVER, WORDCLASSES, RULE_INDEX], tagger_options())
 
     yield
     # Shutdown
@@ -226,6 +344,8 @@ async def lifespan(_app: FastAPI):
         await DRIVER.close()
     if ENGINE is not None:  # close data db connection.
         await ENGINE.dispose()
+    if CACHE_WRITER is not None:  # finish pending cache writes.
+        await CACHE_WRITER.close()
     if CACHE is not None:  # close cache connection.
         await CACHE.close()
 
@@ -316,42 +436,42 @@ async def tag_text(text: str, request: Request,
     (doc_id,) = ins.inserted_primary_key
     logging.info("Started tagging %s", doc_id)
     text = re.sub(r'\n\s*\n', ' PZPZPZ\n\n', text)  # detect paragraph breaks.
-    tokens = RegexTokenizer().tokenize(text)
-    type_count = Counter([token.type for token in tokens])
+    tokens = RegexTokenizer().tokenize_table(text)
+    type_count = count_token_types(tokens)
     await sql.execute(update(Tagging).where(Tagging.id == doc_id).values(
         word_count=type_count[TokenType.WORD]))
-    tagger = DocuscopeTaggerNeo(return_untagged_tags=True, return_no_rules_tags=True,
-                                return_included_tags=True, wordclasses=WORDCLASSES,
-                                driver=DRIVER, cache=CACHE)
-    tagger_gen = tagger.tag_next(tokens)
+    tagger = TEXT_TAGGER.context()
     timeout = start_time + 1
     indx = 0
-    while True:
-        if await request.is_disconnected():
-            await sql.execute(update(Tagging).where(Tagging.id == doc_id).values(
-                state='abort', detail={"processed": indx, "token_count": len(tokens)}))
-            await sql.commit()
-            logging.warning("Client Disconnected on %s!", doc_id)
-            return
-        try:
-            indx = await tagger_gen.asend(None)
-        except StopAsyncIteration:
-            break
-        except Exception as exp:
-            await sql.execute(update(Tagging).where(Tagging.id == doc_id).values(
-                state='error',
-                detail={"processed": indx, "token_count": len(tokens), "error": str(exp)}))
-            await sql.commit()
-            raise
-        if perf_counter() > timeout:
-            timeout = perf_counter() + 1
-            await sql.execute(update(Tagging).where(Tagging.id == doc_id).values(
-                detail={"processed": indx, "token_count": len(tokens)}))
-            yield ServerSentEvent(
-                event='processing',
-                data=Message(
-                    doc_id=doc_id, status=f"{indx * 100 // len(tokens)}").model_dump_json()
-            ).model_dump()
+    # Closing the generator ends the document's neo4j session even when
+    # the client disconnects.
+    async with aclosing(tagger.tag_next(tokens)) as tagger_gen:
+        while True:
+            if await request.is_disconnected():
+                await sql.execute(update(Tagging).where(Tagging.id == doc_id).values(
+                    state='abort', detail={"processed": indx, "token_count": len(tokens)}))
+                await sql.commit()
+                logging.warning("Client Disconnected on %s!", doc_id)
+                return
+            try:
+                indx = await tagger_gen.asend(None)
+            except StopAsyncIteration:
+                break
+            except Exception as exp:
+                await sql.execute(update(Tagging).where(Tagging.id == doc_id).values(
+                    state='error',
+                    detail={"processed": indx, "token_count": len(tokens), "error": str(exp)}))
+                await sql.commit()
+                raise
+            if perf_counter() > timeout:
+                timeout = perf_counter() + 1
+                await sql.execute(update(Tagging).where(Tagging.id == doc_id).values(
+                    detail={"processed": indx, "token_count": len(tokens)}))
+                yield ServerSentEvent(
+                    event='processing',
+                    data=Message(
+                        doc_id=doc_id, status=f"{indx * 100 // len(tokens)}").model_dump_json()
+                ).model_dump()
     await sql.execute(update(Tagging).where(Tagging.id == doc_id).values(
         detail={"processed": len(tokens), "token_count": len(tokens)}))
     yield ServerSentEvent(
@@ -381,7 +501,8 @@ async def tag_text(text: str, request: Request,
         detail={
             "processed": len(tokens),
             "token_count": len(tokens),
-            "patterns": patterns
+            "patterns": patterns,
+            "backend": tagger.backend
         }))
     yield ServerSentEvent(
         data=DocuScopeDocument(
@@ -398,8 +519,7 @@ async def tag_text(text: str, request: Request,
 async def tag_document(  # pylint: disable=too-many-locals,too-many-branches,too-many-statements
         doc_id: UUID,
         request: Request,
-        sql: AsyncSession,
-        cache: aiomcache.Client) -> AsyncIterator[ServerSentEvent]:
+        sql: AsyncSession) -> AsyncIterator[ServerSentEvent]:
     """Incrementally tag the given database document."""
     start_time = perf_counter()
     query: Result = await sql.execute(select(Submission.content, Submission.name)
@@ -434,26 +554,24 @@ async def tag_document(  # pylint: disable=too-many-locals,too-many-branches,too
                                   event='submitted').model_dump()
         try:
             tokenizer = RegexTokenizer()
-            tokens = tokenizer.tokenize(doc_content)
-            tagger = DocuscopeTaggerNeo(return_untagged_tags=False, return_no_rules_tags=True,
-                                        return_included_tags=True, wordclasses=WORDCLASSES,
-                                        driver=DRIVER, cache=cache)
-            tagger_gen = tagger.tag_next(tokens)
+            tokens = tokenizer.tokenize_table(doc_content)
+            tagger = TAGGER.context()
             timeout = start_time + 1  # perf_counter returns seconds.
-            while True:
-                try:
-                    indx = await tagger_gen.asend(None)
-                except StopAsyncIteration:
-                    break
-                if perf_counter() > timeout:
-                    timeout = perf_counter() + 1
-                    if not await request.is_disconnected():
-                        yield ServerSentEvent(
-                            event='processing',
-                            data=Message(
-                                doc_id=doc_id,
-                                status=f"{indx * 100 // len(tokens)}").model_dump_json()
-                        ).model_dump()
+            async with aclosing(tagger.tag_next(tokens)) as tagger_gen:
+                while True:
+                    try:
+                        indx = await tagger_gen.asend(None)
+                    except StopAsyncIteration:
+                        break
+                    if perf_counter() > timeout:
+                        timeout = perf_counter() + 1
+                        if not await request.is_disconnected():
+                            yield ServerSentEvent(
+                                event='processing',
+                                data=Message(
+                                    doc_id=doc_id,
+                                    status=f"{indx * 100 // len(tokens)}").model_dump_json()
+                            ).model_dump()
             if not await request.is_disconnected():
                 yield ServerSentEvent(
                     event='processing',
@@ -490,7 +608,7 @@ async def tag_document(  # pylint: disable=too-many-locals,too-many-branches,too
             raise HTTPException(
                 detail="No tokens for %s becuase the document has no recognizable text content.",
                 status_code=status.HTTP_400_BAD_REQUEST)
-        type_count = Counter([token.type for token in tokens])
+        type_count = count_token_types(tokens)
         not_excluded = set(TokenType) - set(tokenizer.excluded_token_types)
         await sql.execute(update(Submission).where(Submission.id == doc_id).values(
             state='tagged',
@@ -505,9 +623,9 @@ async def tag_document(  # pylint: disable=too-many-locals,too-many-branches,too
                                         for itype in not_excluded),
                 num_excluded_tokens=sum(
                     type_count[etype] for etype in tokenizer.excluded_token_types),
-                tag_chain=[tag.rules[0][0].split(
-                    '.')[-1] for tag in tagger.tags],
-                tagging_time=timedelta(seconds=perf_counter() - start_time)
+                tag_chain=tagger.tags.rule_names(short=True),
+                tagging_time=timedelta(seconds=perf_counter() - start_time),
+                backend=tagger.backend
             )).model_dump()
         ))
         await sql.commit()
@@ -568,7 +686,7 @@ async def tag_database_document(
     state = result.scalar_one_or_none()
     if state == 'pending':
         # check for too many submitted? Need to find limit emperically.
-        tagging = tag_document(uuid, request, sql, CACHE)
+        tagging = tag_document(uuid, request, sql)
         return EventSourceResponse(tagging)
     if state == 'submitted':
         return Message(doc_id=uuid, status=f"{uuid} already submitted.")
@@ -584,9 +702,7 @@ async def tag_database_document(
                         status_code=status.HTTP_503_SERVICE_UNAVAILABLE)
 
 
-async def tag_documents(
-    request: Request, cache: aiomcache.Client
-) -> AsyncIterator[ServerSentEvent]:
+async def tag_documents(request: Request) -> AsyncIterator[ServerSentEvent]:
     """Tag all pending documents in the database."""
     sql: AsyncSession
     while True:  # wait until outstanding processing is done.
@@ -608,7 +724,7 @@ async def tag_documents(
             docid = pending.scalar_one_or_none()
             if docid:
                 logging.info("Tagging %s", docid)
-                tag_next = tag_document(docid, request, sql, cache)
+                tag_next = tag_document(docid, request, sql)
                 while True:
                     try:
                         if await request.is_disconnected():
@@ -629,7 +745,7 @@ async def tag_documents(
 async def tag_all_pending_documents(
         request: Request):
     """Tag all of the pending documents in the database while emitting sse's on progress."""
-    return EventSourceResponse(tag_documents(request, CACHE))
+    return EventSourceResponse(tag_documents(request))
 
 
 class Status(BaseModel):
@@ -663,6 +779,94 @@ async def states_all_documents(sql: AsyncSession = Depends(session)) -> list[Sta
     return [Status(state=state, count=count) for (state, count) in result.all()]
 
 
+class LocalCacheStatus(BaseModel):
+    """Counters of the in-process rule cache."""
+    entries: int = 0
+    bytes: int = 0
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+
+
+class CacheWriterStatus(BaseModel):
+    """Counters of the memcache write-behind queue."""
+    queued: int = 0
+    written: int = 0
+    dropped: int = 0
+    errors: int = 0
+    flushes: int = 0
+    last_flush_seconds: float = 0
+    max_flush_seconds: float = 0
+
+
+class LookupStatus(BaseModel):
+    """Cache effectiveness for one kind of rule lookup."""
+    lookups: int = 0
+    local_hits: int = 0
+    memcache_hits: int = 0
+    stored: int = 0
+    hit_rate: float = 0
+    queries: int = 0
+    acquire_seconds: float = 0
+
+
+class SingleFlightStatus(BaseModel):
+    """Counters of the neo4j lookups shared between concurrent taggers."""
+    in_flight: int = 0
+    fetched: int = 0
+    shared: int = 0
+
+
+class CacheStatus(BaseModel):
+    """Return type for /status/cache requests."""
+    namespace: str
+    mode: str
+    lookups: dict[str, LookupStatus]
+    surface: LocalCacheStatus
+    single_flight: SingleFlightStatus
+    local: LocalCacheStatus
+    writer: CacheWriterStatus
+    warmup: Optional[WarmupReport] = None  # of the startup
+
+
+@app.get('/status/cache', response_model=CacheStatus)
+async def rule_cache_status() -> CacheStatus:
+    """Get the counters of the in-process rule cache and the memcache writer."""
+    return CacheStatus(
+        namespace=CACHE_NAMESPACE,
+        mode=SETTINGS.rule_cache_mode,
+        lookups={kind: LookupStatus(**stats) for kind, stats in LOOKUP_STATS.stats().items()},
+        surface=LocalCacheStatus(**SURFACE_CACHE.stats()) if SURFACE_CACHE is not None
+        else LocalCacheStatus(),
+        single_flight=SingleFlightStatus(**SINGLE_FLIGHT.stats()),
+        local=LocalCacheStatus(**LOCAL_CACHE.stats()) if LOCAL_CACHE is not None
+        else LocalCacheStatus(),
+        writer=CacheWriterStatus(**CACHE_WRITER.stats()) if CACHE_WRITER is not None
+        else CacheWriterStatus(),
+        warmup=WARMUP)
+
+
+class BackendStatus(BaseModel):
+    """Return type for /status/backend requests."""
+    state: str
+    failures: int = 0
+    calls: int = 0
+    errors: int = 0
+    timeouts: int = 0
+    slow_calls: int = 0
+    rejected: int = 0
+    trips: int = 0
+    last_error: str = ""
+    fallback: bool = False
+
+
+@app.get('/status/backend', response_model=BackendStatus)
+async def rule_backend_status() -> BackendStatus:
+    """Get the state of the neo4j circuit breaker and whether local rules can take over."""
+    return BackendStatus(**CIRCUIT_BREAKER.stats(), fallback=FALLBACK_RULES is not None)
+
+
 @app.get('/status/{uuid}', response_model=StatusState, response_model_exclude_none=True,
          responses={
              status.HTTP_404_NOT_FOUND: {
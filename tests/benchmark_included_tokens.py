@@ -0,0 +1,53 @@
+"""Benchmark of the included token index against walking the tokens.
+
+Times the lookahead that the tagging loop does at every token, finding the
+next few included tokens, both ways on the same synthetic document, and
+checks that they agree.  Run with:
+    python -m tests.benchmark_included_tokens --words 100000
+"""
+import argparse
+import timeit
+
+from app.ity.taggers.docuscope_tagger import DocuscopeTagger
+from app.ity.tokenizers.regex_tokenizer import RegexTokenizer
+
+from .reference import make_text, next_tokens_in_range
+
+
+def indexed(tagger: DocuscopeTagger, start: int, end: int) -> list:
+    """Tagger.get_next_tokens_in_range, which uses the index."""
+    return tagger.get_next_tokens_in_range(start, end)
+
+
+def lookahead(tagger: DocuscopeTagger, next_tokens) -> list:
+    """The next four included tokens from every token, found with next_tokens."""
+    found = []
+    for token_index in range(len(tagger.tokens)):
+        tagger.token_index = token_index
+        found.append(next_tokens(tagger, 0, 4))
+    return found
+
+
+def main():
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--words', type=int, default=100000,
+                        help="Number of words in the document.")
+    parser.add_argument('--repeat', type=int, default=3,
+                        help="Number of timings to take the best of.")
+    args = parser.parse_args()
+    tagger = DocuscopeTagger()
+    tagger.tokens = RegexTokenizer().tokenize(make_text(words=args.words))
+    if lookahead(tagger, indexed) != lookahead(tagger, next_tokens_in_range):
+        raise AssertionError("The index and the walk found different tokens.")
+    timings = {}
+    for name, next_tokens in (("walk", next_tokens_in_range), ("index", indexed)):
+        timings[name] = min(timeit.repeat(lambda next_tokens=next_tokens:
+                                          lookahead(tagger, next_tokens),
+                                          number=1, repeat=args.repeat))
+        print(f"{name:>6}: {timings[name]:.3f}s for {len(tagger.tokens)} tokens")
+    print(f"speedup: {timings['walk'] / timings['index']:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+""" Reference implementations and synthetic documents for the tests and benchmarks. """
+# coding=utf-8
+import random
+from collections.abc import Sequence
+from itertools import product
+from typing import Optional
+
+from app.ity.taggers.docuscope_tagger import DocuscopeDictionary, DocuscopeTagger
+from app.ity.taggers.docuscope_tagger_base import LatRule, rule_applies_for_tokens
+from app.ity.taggers.tagger import Tagger
+from app.ity.tokenizers.tokenizer import Token
+
+WORDS = ["we", "the", "of", "in", "order", "to", "on", "other", "hand", "a",
+         "argue", "that", "this", "is", "not", "it", "as", "shown", "by", "data"]
+
+
+def make_text(seed: int = 1, words: int = 1000) -> str:
+    """A document of words and punctuation with runs of spaces and paragraph breaks."""
+    rnd = random.Random(seed)
+    parts = []
+    for _ in range(words):
+        parts.append(rnd.choice(WORDS))
+        mark = rnd.random()
+        if mark < 0.05:
+            parts.append(".\n\n")
+        elif mark < 0.1:
+            parts.append(", ")
+        elif mark < 0.15:
+            parts.append("   ")
+        else:
+            parts.append(" ")
+    return "".join(parts)
+
+
+def nth_next_included_token_index(tagger: Tagger,
+                                  starting_token_index: Optional[int] = None,
+                                  offset: int = 1) -> Optional[int]:
+    """Tagger._get_nth_next_included_token_index as a walk over the tokens."""
+    if starting_token_index is None:
+        starting_token_index = tagger.token_index
+    next_token_index = starting_token_index
+    while offset > 0:
+        next_token_index += 1
+        if next_token_index >= len(tagger.tokens):
+            break
+        if tagger.tokens[next_token_index].type not in tagger.excluded_token_types:
+            offset -= 1
+    if offset > 0:
+        return None
+    return next_token_index
+
+
+def next_tokens_in_range(tagger: Tagger, start: int, end: int) -> list[Token]:
+    """Tagger.get_next_tokens_in_range by walking from token to token."""
+    tokens = []
+    token_index = nth_next_included_token_index(tagger, offset=start)
+    while token_index is not None and start < end:
+        tokens.append(tagger.tokens[token_index])
+        token_index = nth_next_included_token_index(tagger, starting_token_index=token_index)
+        start += 1
+    return tokens
+
+
+def make_dictionary(seed: int = 1, rules: int = 300) -> DocuscopeDictionary:
+    """
+    A JSON dictionary for WORDS with many wordclasses per word, in random
+    order and sometimes repeated, and short rules, so that rules of the
+    same length often tie.
+    """
+    rnd = random.Random(seed)
+    classes = [f"!CLASS{number}" for number in range(8)]
+    words = {word: [word, *(rnd.choice(classes) for _ in range(rnd.randint(0, 5)))]
+             for word in WORDS}
+    for wordclasses in words.values():
+        rnd.shuffle(wordclasses)
+    symbols = WORDS + classes * 2
+    long_rules: dict = {}
+    for _ in range(rules):
+        path = [rnd.choice(symbols) for _ in range(rnd.choice([2, 2, 3, 3, 4, 5, 7]))]
+        long_rules.setdefault(path[0], {}).setdefault(path[1], {}).setdefault(
+            rnd.choice(["LatA", "LatB", "LatC", "LatD"]), []).append(path[2:])
+    return {"words": words, "rules": long_rules,
+            "shortRules": {symbol: "LatShort" for symbol in rnd.sample(symbols, 10)}}
+
+
+def greedy_long_rule(rules_db: dict, ds_words: Sequence[list[str]]) -> Optional[LatRule]:
+    """
+    DocuscopeTagger's long rule search before RuleAutomaton: every rule
+    starting with each pair of the first two tokens' wordclasses, sorted
+    longest first, and the first of them that applies.
+
+    :param ds_words: the wordclasses of the current and following included
+                     tokens, at least as many as the longest rule.
+    """
+    if len(ds_words) < 2:
+        return None
+    rules: list[LatRule] = []
+    for first, second in product(ds_words[0], ds_words[1]):
+        for lat, paths in rules_db.get(first, {}).get(second, {}).items():
+            for path in paths:
+                rules.append({"lat": lat, "path": [first, second, *path]})
+    rules.sort(reverse=True, key=lambda rule: len(rule['path']))
+    tokens = [set(words) for words in ds_words[:len(rules[0]['path'])]] if rules else []
+    return next((rule for rule in rules
+                 if rule_applies_for_tokens(rule['path'], tokens, offset=2)), None)
+
+
+class GreedyDocuscopeTagger(DocuscopeTagger):
+    """DocuscopeTagger finding its long rules with greedy_long_rule."""
+
+    def find_long_rule(self) -> Optional[LatRule]:
+        longest = max((len(path) + 2 for seconds in self.rules_db.values()
+                       for lats in seconds.values()
+                       for paths in lats.values() for path in paths), default=2)
+        return greedy_long_rule(self.rules_db, [
+            self._get_ds_words_for_token_index(index)
+            for index in self._get_next_token_indexes_in_range(0, longest)])
+
+    @property
+    def _rule_starts(self) -> None:
+        return None  # every token is tried
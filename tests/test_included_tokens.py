@@ -0,0 +1,56 @@
+""" The included token index gives the same lookahead as walking the tokens. """
+# coding=utf-8
+import unittest
+
+from app.ity.taggers.docuscope_tagger import DocuscopeTagger
+from app.ity.tokenizers.regex_tokenizer import RegexTokenizer
+from app.ity.tokenizers.tokenizer import TokenType
+
+from .reference import make_text, next_tokens_in_range, nth_next_included_token_index
+
+
+class IncludedTokensTest(unittest.TestCase):
+    """Tagger's lookahead navigation against the walk it replaced."""
+
+    def setUp(self):
+        self.tokens = RegexTokenizer().tokenize(make_text(words=400))
+
+    def check(self, tagger: DocuscopeTagger) -> None:
+        """Compare every start and offset, including past both ends."""
+        tagger.tokens = self.tokens
+        for start in range(-1, len(self.tokens) + 1):
+            for offset in range(0, 6):
+                self.assertEqual(
+                    tagger._get_nth_next_included_token_index(start, offset),  # pylint: disable=protected-access
+                    nth_next_included_token_index(tagger, start, offset),
+                    (start, offset))
+        for token_index in range(len(self.tokens)):
+            tagger.token_index = token_index
+            for start, end in ((0, 4), (1, 4), (2, 27), (3, 2)):
+                self.assertEqual(tagger.get_next_tokens_in_range(start, end),
+                                 next_tokens_in_range(tagger, start, end),
+                                 (token_index, start, end))
+
+    def test_default_excluded_types(self):
+        """Whitespace and newlines are skipped."""
+        self.check(DocuscopeTagger())
+
+    def test_excluded_punctuation(self):
+        """Any excluded token types are skipped."""
+        self.check(DocuscopeTagger(excluded_token_types=(
+            TokenType.WHITESPACE, TokenType.NEWLINE, TokenType.PUNCTUATION)))
+
+    def test_no_excluded_types(self):
+        """Every token is included."""
+        self.check(DocuscopeTagger(excluded_token_types=()))
+
+    def test_retokenized(self):
+        """Setting new tokens rebuilds the index."""
+        tagger = DocuscopeTagger()
+        tagger.tokens = RegexTokenizer().tokenize(make_text(seed=2, words=50))
+        tagger.get_next_tokens_in_range(0, 4)
+        self.check(tagger)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+""" RuleAutomaton finds the same long rules as DocuscopeTagger's greedy search. """
+# coding=utf-8
+import random
+import unittest
+
+from app.ity.taggers.docuscope_tagger import DocuscopeTagger
+from app.ity.taggers.rule_automaton import RuleAutomaton
+from app.ity.tokenizers.regex_tokenizer import RegexTokenizer
+
+from .reference import (WORDS, GreedyDocuscopeTagger, greedy_long_rule,
+                        make_dictionary, make_text)
+
+# Rules of the same length that tie in each of the ways the greedy search
+# orders them: by first wordclass, by second wordclass, and by rule.
+TIES = {
+    "!PRON": {"!VERB": {"LatFirst2": [["that"]]}},
+    "we": {"!VERB": {"LatFirst1": [["that"]]},
+           "argue": {"LatSecond2": [["!CONJ"]]},
+           "!CLAIM": {"LatRule1": [["!DET"]], "LatRule2": [["!DET"], ["that"]]}},
+    "!SUBJ": {"argue": {"LatRule3": [["that"], ["!CONJ"]]}},
+}
+TIE_WORDS = {"we": ["!SUBJ", "we", "!PRON"],
+             "argue": ["!CLAIM", "argue", "!VERB"],
+             "that": ["!DET", "that", "!CONJ"]}
+
+
+def tags(tagger: DocuscopeTagger, tokens: list) -> list[tuple]:
+    """The rules, without the tagger's label, and the span of each tag."""
+    context = tagger.tag_context_sync(tokens)
+    label = len(tagger.full_label)
+    return [(tuple((name[label:], tuple(path)) for name, path in tag.rules),
+             tag.index_start, tag.index_end, tag.num_included_tokens)
+            for tag in context.tags]
+
+
+class RuleAutomatonTest(unittest.TestCase):
+    """RuleAutomaton.match and scan against greedy_long_rule."""
+
+    def check(self, rules_db: dict, ds_words: list[list[str]]) -> None:
+        """Compare the rules found from every position of ds_words."""
+        automaton = RuleAutomaton(rules_db)
+        encoded = [automaton.encode(words) for words in ds_words]
+        scanned = automaton.scan(encoded)
+        for position in range(len(ds_words)):
+            expected = greedy_long_rule(rules_db, ds_words[position:])
+            self.assertEqual(automaton.match(encoded[position:]), expected, position)
+            self.assertEqual(scanned.get(position), expected, position)
+
+    def test_ties(self):
+        """Equal length rules are chosen the way the greedy search chose them."""
+        for order in (["we", "argue", "that"], ["we", "we", "argue", "that", "that"]):
+            self.check(TIES, [TIE_WORDS[word] for word in order])
+        reordered = {word: list(reversed(wordclasses))
+                     for word, wordclasses in TIE_WORDS.items()}
+        self.check(TIES, [reordered[word] for word in ["we", "argue", "that"]])
+
+    def test_random_dictionaries(self):
+        """Many dictionaries and documents with frequent ties."""
+        for seed in range(30):
+            dictionary = make_dictionary(seed)
+            rnd = random.Random(seed)
+            ds_words = [dictionary["words"][rnd.choice(WORDS)] if rnd.random() > 0.05 else []
+                        for _ in range(150)]
+            self.check(dictionary["rules"], ds_words)
+
+
+class DocuscopeTaggerTest(unittest.TestCase):
+    """DocuscopeTagger's tags against those of the greedy search."""
+
+    def check(self, allow_overlapping_tags: bool) -> None:
+        """Tag documents both ways."""
+        for seed in range(5):
+            dictionary = make_dictionary(seed)
+            tokens = RegexTokenizer().tokenize(make_text(seed, words=300))
+            options = {"dictionary": dictionary, "return_included_tags": True,
+                       "allow_overlapping_tags": allow_overlapping_tags}
+            self.assertEqual(tags(DocuscopeTagger(**options), tokens),
+                             tags(GreedyDocuscopeTagger(**options), tokens), seed)
+
+    def test_tags(self):
+        """Tags of the tagging loop."""
+        self.check(allow_overlapping_tags=False)
+
+    def test_overlapping_tags(self):
+        """Tags of every token, found by RuleAutomaton.scan."""
+        self.check(allow_overlapping_tags=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
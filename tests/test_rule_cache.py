@@ -0,0 +1,142 @@
+""" The memcache write-behind queue and the encoding of cached rule lookups. """
+# coding=utf-8
+import asyncio
+import json
+import unittest
+
+from app.ity.taggers.rule_cache import (CacheWriter, _pack, _unpack, _RAW, _ZLIB,
+                                        decode_rules, decode_short_rule, encode_rules,
+                                        encode_short_rule)
+
+RULES = [{"lat": "Citations", "path": ["as", "shown", "by", "!DATA"]},
+         {"lat": "Reasoning", "path": ["in", "order", "to"]},
+         {"lat": "Contrast", "path": ["on", "the", "other", "hand"]},
+         {"lat": "Résumé", "path": ["naïve", "café"]}]
+
+
+class FakeCache:
+    """The part of aiomcache.Client that the rule caches use."""
+
+    def __init__(self, failing: frozenset = frozenset()):
+        self.data: dict[bytes, bytes] = {}
+        self.failing = failing  # keys whose sets raise
+        self.blocked = asyncio.Event()  # sets wait for this when it is cleared
+        self.blocked.set()
+
+    async def set(self, key: bytes, value: bytes) -> bool:
+        """Store value, failing for the failing keys."""
+        await self.blocked.wait()
+        if key in self.failing:
+            raise ConnectionError(f"failed to set {key!r}")
+        self.data[key] = value
+        return True
+
+    async def get(self, key: bytes) -> bytes | None:
+        """The stored value, if any."""
+        return self.data.get(key)
+
+
+class CacheWriterTest(unittest.IsolatedAsyncioTestCase):
+    """CacheWriter queueing, dropping, and flushing."""
+
+    async def test_flush_writes_queued(self):
+        """flush waits until every queued value is written, in batches."""
+        cache = FakeCache()
+        writer = CacheWriter(cache, batch_size=2)
+        for number in range(5):
+            self.assertTrue(writer.put(b"key%d" % number, b"value%d" % number))
+        await writer.flush()
+        self.assertEqual(cache.data, {b"key%d" % number: b"value%d" % number
+                                      for number in range(5)})
+        stats = writer.stats()
+        self.assertEqual((stats["queued"], stats["written"], stats["dropped"],
+                          stats["errors"], stats["flushes"]), (0, 5, 0, 0, 3))
+        self.assertGreaterEqual(stats["max_flush_seconds"], stats["last_flush_seconds"])
+        await writer.close()
+
+    async def test_queue_limit(self):
+        """Values beyond max_queue are dropped and counted, not waited on."""
+        cache = FakeCache()
+        writer = CacheWriter(cache, max_queue=3)
+        accepted = [writer.put(b"key%d" % number, b"value") for number in range(5)]
+        self.assertEqual(accepted, [True, True, True, False, False])
+        self.assertEqual((writer.stats()["queued"], writer.stats()["dropped"]), (3, 2))
+        await writer.flush()
+        self.assertEqual(set(cache.data), {b"key0", b"key1", b"key2"})
+        self.assertTrue(writer.put(b"key5", b"value"))  # room again
+        await writer.close()
+        self.assertEqual((writer.written, writer.dropped), (4, 2))
+
+    async def test_errors(self):
+        """Failed sets are counted and do not stop the other writes."""
+        cache = FakeCache(failing=frozenset({b"key1"}))
+        writer = CacheWriter(cache)
+        for number in range(3):
+            writer.put(b"key%d" % number, b"value")
+        with self.assertLogs(level="WARNING"):
+            await writer.flush()
+        self.assertEqual(set(cache.data), {b"key0", b"key2"})
+        self.assertEqual((writer.written, writer.errors), (2, 1))
+        await writer.close()
+
+    async def test_flush_timeout(self):
+        """A stalled cache does not hold up flush past its timeout."""
+        cache = FakeCache()
+        cache.blocked.clear()
+        writer = CacheWriter(cache)
+        writer.put(b"key", b"value")
+        with self.assertLogs(level="WARNING"):
+            await writer.flush(timeout=0.01)
+        self.assertEqual(writer.written, 0)
+        with self.assertLogs(level="WARNING"):
+            await writer.close(timeout=0.01)
+        self.assertEqual(cache.data, {})
+
+    async def test_flush_idle(self):
+        """Flushing and closing without writes return at once."""
+        writer = CacheWriter(FakeCache())
+        await writer.flush()
+        await writer.close()
+        self.assertEqual(writer.stats()["flushes"], 0)
+
+
+class EncodingTest(unittest.TestCase):
+    """Round trips of the compact encoding of cached rule lookups."""
+
+    def test_pack(self):
+        """Records of strings come back as they were."""
+        records = [["Citations", "as", "shown"], ["x"], ["a", "", "b"]]
+        for threshold in (0, 8, 512):
+            self.assertEqual(_unpack(_pack(records, threshold)), records)
+        self.assertEqual(_unpack(_pack([], 0)), [])
+
+    def test_compression(self):
+        """Payloads longer than compress_threshold are compressed."""
+        records = [["Reasoning", "in", "order", "to"]] * 50
+        self.assertEqual(_pack(records, 512)[:1], _ZLIB)
+        self.assertEqual(_pack(records, 0)[:1], _RAW)  # 0 never compresses
+        self.assertEqual(_pack(records[:1], 512)[:1], _RAW)
+        self.assertLess(len(_pack(records, 512)), len(_pack(records, 0)))
+        self.assertEqual(_unpack(_pack(records, 512)), records)
+
+    def test_rules(self):
+        """Long rule lookup results, compressed or not."""
+        for threshold in (0, 16, 512):
+            self.assertEqual(decode_rules(encode_rules(RULES, threshold)), RULES)
+            self.assertEqual(decode_rules(encode_rules([], threshold)), [])
+
+    def test_short_rules(self):
+        """Short rule lookup results, including no rule."""
+        for rule in (("Reasoning", "because"), ("Résumé", "café"), (None, None)):
+            self.assertEqual(decode_short_rule(encode_short_rule(rule)), rule)
+
+    def test_json(self):
+        """Entries written as json by earlier versions are still read."""
+        self.assertEqual(decode_rules(json.dumps(RULES).encode('utf-8')), RULES)
+        self.assertEqual(decode_short_rule(b'["Reasoning", "because"]'),
+                         ("Reasoning", "because"))
+        self.assertEqual(decode_short_rule(b'[null, null]'), (None, None))
+
+
+if __name__ == '__main__':
+    unittest.main()